@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic e-book corpus.
+"""
+
+from os import makedirs
+from os.path import join, exists
+import random
+import zipfile
+
+_CONTAINER = ('<?xml version="1.0"?>'
+              '<container version="1.0" xmlns="urn:oasis:names:tc:'
+              'opendocument:xmlns:container">'
+              '<rootfiles>'
+              '<rootfile full-path="OEBPS/content.opf" '
+              'media-type="application/oebps-package+xml"/>'
+              '</rootfiles>'
+              '</container>')
+
+_WORDS = ('amber', 'bridge', 'cellar', 'distant', 'ember', 'falcon',
+          'garden', 'harbour', 'island', 'juniper', 'kestrel', 'lantern',
+          'meadow', 'night', 'orchard', 'pilgrim', 'quarry', 'river',
+          'silver', 'thistle', 'umber', 'valley', 'winter', 'yarrow')
+
+
+def opf(title, author, isbn=None, manifest_size=0):
+    """Returns an OPF document with `manifest_size` manifest and spine
+    items.
+    """
+    identifier = ''
+    if isbn is not None:
+        identifier = ('<dc:identifier opf:scheme="ISBN">%s</dc:identifier>'
+                      % isbn)
+    items = ''.join('<item id="c%d" href="text/c%d.xhtml" '
+                    'media-type="application/xhtml+xml"/>' % (i, i)
+                    for i in xrange(manifest_size))
+    spine = ''.join('<itemref idref="c%d"/>' % i
+                    for i in xrange(manifest_size))
+    return ('<?xml version="1.0" encoding="utf-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/" '
+            'xmlns:opf="http://www.idpf.org/2007/opf">'
+            '<dc:title>%s</dc:title>'
+            '<dc:creator opf:role="aut">%s</dc:creator>'
+            '<dc:language>en</dc:language>'
+            '%s'
+            '</metadata>'
+            '<manifest>%s</manifest>'
+            '<spine>%s</spine>'
+            '</package>') % (title, author, identifier, items, spine)
+
+
+def write_epub(path, title, author, isbn=None, manifest_size=0):
+    """Writes an e-book with the given metadata.
+    """
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as epub:
+        epub.writestr('mimetype', 'application/epub+zip')
+        epub.writestr('META-INF/container.xml', _CONTAINER)
+        epub.writestr('OEBPS/content.opf',
+                      opf(title, author, isbn, manifest_size))
+
+
+def generate(directory, count, manifest_size=0, authors=100, isbns=1.0,
+             seed=0):
+    """Writes `count` e-books to a directory, by `authors` different
+    authors. A fraction `isbns` of them have an ISBN. Returns the
+    paths written.
+    """
+    rand = random.Random(seed)
+    names = ['%s, %s' % (rand.choice(_WORDS).title(),
+                         rand.choice(_WORDS).title()) + ' %d' % i
+             for i in xrange(max(1, authors))]
+    if not exists(directory):
+        makedirs(directory)
+    paths = []
+    for i in xrange(count):
+        title = ' '.join(rand.choice(_WORDS) for _ in xrange(3)).title()
+        title += ' %d' % i
+        isbn = None
+        if rand.random() < isbns:
+            isbn = '978%010d' % i
+        path = join(directory, 'book%06d.epub' % i)
+        write_epub(path, title, names[i % len(names)], isbn, manifest_size)
+        paths.append(path)
+    return paths
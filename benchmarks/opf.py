@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares reading OPF metadata with a full ElementTree parse to the
+incremental parse which stops after the metadata, on synthetic e-books
+with large manifests.
+
+    python -m benchmarks.opf [count]
+"""
+
+from os.path import join
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+from roots.format import EpubFormat
+
+from benchmarks.corpus import generate
+
+MANIFEST_SIZES = (10, 1000, 10000)
+
+
+def full_load(cls, path):
+    """Reads metadata the way roots 1.0 did."""
+    if not zipfile.is_zipfile(path):
+        return
+    with zipfile.ZipFile(path, 'r') as epub_file:
+        container = ET.fromstring(epub_file.read('META-INF/container.xml'))
+        full_path = cls._search(container, 'rootfile').attrib['full-path']
+        root = ET.fromstring(epub_file.read(full_path))
+    return {
+        'title': cls._search(root, 'title'),
+        'author': cls._author(cls._search(root, 'creator')),
+        'isbn': cls._isbn(cls._search(root, 'identifier', 'isbn')) or ''
+    }
+
+
+def incremental_load(cls, path):
+    return cls.load(path)
+
+
+def timed(function, cls, paths):
+    """Returns the mean time taken to read each path."""
+    start = time.time()
+    for path in paths:
+        function(cls, path)
+    return (time.time() - start) / len(paths)
+
+
+def main(count=100):
+    cls = EpubFormat({'import': {'hash': False}})
+    print('%10s %14s %14s %8s' % ('manifest', 'full (ms)', 'incr. (ms)',
+                                  'speedup'))
+    for size in MANIFEST_SIZES:
+        directory = tempfile.mkdtemp()
+        try:
+            paths = generate(join(directory, 'books'), count, size)
+            assert full_load(cls, paths[0]) == incremental_load(cls, paths[0])
+            full = timed(full_load, cls, paths)
+            incremental = timed(incremental_load, cls, paths)
+        finally:
+            shutil.rmtree(directory)
+        print('%10d %14.3f %14.3f %7.1fx' % (size, full * 1000,
+                                             incremental * 1000,
+                                             full / incremental))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
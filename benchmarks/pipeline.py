@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks for the import and update pipeline.
+
+Generates synthetic libraries of each size and times the hot paths,
+writing the results as JSON so runs can be compared across commits.
+
+    python -m benchmarks.pipeline --sizes 1000,10000 --output new.json
+    python -m benchmarks.pipeline --compare old.json new.json
+"""
+
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from datetime import datetime
+from os import devnull, makedirs
+from os.path import join
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from roots.configuration import default_configuration, compile_regex
+from roots.command import List
+from roots.format import EpubFormat
+from roots import files
+from roots import storage
+
+from benchmarks.corpus import generate
+
+SIZES = (1000, 10000, 100000)
+
+
+def run(size, manifest_size, authors, isbns):
+    """Times each stage on a library of `size` books. Returns a list of
+    results.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        configuration = default_configuration()
+        configuration['directory'] = join(directory, 'library')
+        configuration['system']['configpath'] = directory
+        configuration['debug'] = False
+        compile_regex(configuration)
+        makedirs(configuration['directory'])
+        inbox = join(directory, 'inbox')
+        paths = generate(inbox, size, manifest_size, authors, isbns)
+        results = []
+
+        def stage(name, function, *args):
+            with _quiet():
+                start = time.time()
+                value = function(*args)
+                seconds = time.time() - start
+            results.append({
+                'size': size,
+                'stage': name,
+                'seconds': seconds,
+                'per_book_ms': seconds * 1000 / size
+            })
+            return value
+
+        book = EpubFormat(configuration)
+        stage('format.load', lambda: [book.load(path) for path in paths])
+        moves, books = stage('files.find_moves', files.find_moves,
+                             configuration, inbox)
+        stage('files.move_to_library', files.move_to_library,
+              configuration, moves)
+        stage('storage.store_books', storage.store_books,
+              configuration, books)
+        stage('storage.replace_books', storage.replace_books,
+              configuration, books)
+        cache = {}
+        stage('files.find_moves (update)', files.find_moves,
+              configuration, configuration['directory'], cache)
+        stage('files.find_moves (update, cached)', files.find_moves,
+              configuration, configuration['directory'], cache)
+        query = {'list': True, '<query>': (), '-t': False, '-a': False,
+                 '-i': False}
+        stage('List.execute', List(query, configuration).execute)
+        query = dict(query, **{'<query>': ('author:%s' %
+                                           books[0]['author'],)})
+        stage('List.execute (author)', List(query, configuration).execute)
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+def compare(old, new):
+    """Prints the change in time of each stage between two runs."""
+    before = {(r['size'], r['stage']): r['seconds'] for r in old['results']}
+    print('%-36s %8s %10s %10s %8s' % ('stage', 'size', 'old (s)',
+                                       'new (s)', 'change'))
+    for result in new['results']:
+        key = (result['size'], result['stage'])
+        if key not in before:
+            continue
+        change = (result['seconds'] - before[key]) / max(before[key], 1e-9)
+        print('%-36s %8d %10.3f %10.3f %+7.0f%%' % (
+            result['stage'], result['size'], before[key], result['seconds'],
+            change * 100))
+
+
+@contextmanager
+def _quiet():
+    """Discards output printed by the stage being timed."""
+    stdout = sys.stdout
+    sys.stdout = open(devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=open(devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help='comma separated library sizes')
+    parser.add_argument('--manifest', type=int, default=50,
+                        help='manifest items in each book')
+    parser.add_argument('--authors', type=int, default=1000,
+                        help='number of different authors')
+    parser.add_argument('--isbns', type=float, default=0.9,
+                        help='fraction of books with an ISBN')
+    parser.add_argument('--output', help='file to write results to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files')
+    arguments = parser.parse_args(argv)
+    if arguments.compare:
+        old, new = [json.load(open(path)) for path in arguments.compare]
+        compare(old, new)
+        return
+    report = {
+        'commit': _commit(),
+        'date': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'manifest': arguments.manifest,
+            'authors': arguments.authors,
+            'isbns': arguments.isbns
+        },
+        'results': []
+    }
+    for size in [int(size) for size in arguments.sizes.split(',')]:
+        results = run(size, arguments.manifest, arguments.authors,
+                      arguments.isbns)
+        for result in results:
+            sys.stderr.write('%-36s %8d %10.3fs\n' % (
+                result['stage'], size, result['seconds']))
+        report['results'].extend(results)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, 'w') as results_file:
+            results_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
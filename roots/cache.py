@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk caches: responses from web services, and what was read from
+the books in the library.
+"""
+
+from threading import Lock
+import shelve
+import time
+
+_DAY = 24 * 60 * 60
+_INDEX = 'index'
+_ENTRY = 'entry:'
+
+
+class ResponseCache(object):
+    """Caches responses by query in a shelve. Responses expire after
+    `ttl` days, and missing responses (cached as None) after
+    `negative_ttl` days. When there are more than `size` entries, the
+    least recently used are evicted.
+    """
+
+    def __init__(self, path, ttl, negative_ttl, size):
+        self._path = path
+        self._ttl = ttl * _DAY
+        self._negative_ttl = negative_ttl * _DAY
+        self._size = size
+        self._lock = Lock()
+        self._shelf = None
+        self._index = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query):
+        """Returns (True, response) if there is a current response for
+        the query, otherwise (False, None).
+        """
+        key = self._key(query)
+        with self._lock:
+            self._open()
+            if key not in self._shelf:
+                self.misses += 1
+                return False, None
+            stored, response = self._shelf[key]
+            ttl = self._ttl if response is not None else self._negative_ttl
+            now = time.time()
+            if now - stored > ttl:
+                del self._shelf[key]
+                self._index.pop(key, None)
+                self.misses += 1
+                return False, None
+            self._index[key] = now
+            self.hits += 1
+            return True, response
+
+    def put(self, query, response):
+        """Caches the response to a query, or None if there was none.
+        """
+        key = self._key(query)
+        with self._lock:
+            self._open()
+            now = time.time()
+            self._shelf[key] = (now, response)
+            self._index[key] = now
+            if len(self._index) > self._size:
+                self._evict()
+
+    def close(self):
+        with self._lock:
+            if self._shelf is not None:
+                self._shelf[_INDEX] = self._index
+                self._shelf.close()
+                self._shelf = None
+                self._index = None
+
+    def _open(self):
+        """Opens the shelve, and its index of when each entry was last
+        used. The index is only saved on close, so entries written by a
+        run which did not close the cache are added to it by when they
+        were stored, and entries which are gone are dropped.
+        """
+        if self._shelf is None:
+            self._shelf = shelve.open(self._path)
+            saved = self._shelf.get(_INDEX, {})
+            self._index = {}
+            for key in self._shelf.keys():
+                if key.startswith(_ENTRY):
+                    used = saved.get(key)
+                    if used is None:
+                        used = self._shelf[key][0]
+                    self._index[key] = used
+
+    def _evict(self):
+        """Removes the least recently used entries, leaving room for a
+        tenth of the cache before the next eviction.
+        """
+        keep = self._size - self._size // 10
+        used = sorted(self._index.iteritems(), key=lambda item: item[1])
+        for key, _ in used[:len(used) - keep]:
+            del self._shelf[key]
+            del self._index[key]
+
+    def _key(self, query):
+        if isinstance(query, unicode):
+            query = query.encode('utf-8')
+        return _ENTRY + query
+
+
+class StatCache(object):
+    """Maps the path of each book to its signature (see
+    `files.signature`) and the metadata read from it, with one entry per
+    path in a shelve, so that only the entries of books which changed
+    are written.
+    """
+
+    def __init__(self, path):
+        self._shelf = shelve.open(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __contains__(self, path):
+        return self._key(path) in self._shelf
+
+    def __getitem__(self, path):
+        return self._shelf[self._key(path)]
+
+    def __setitem__(self, path, entry):
+        self._shelf[self._key(path)] = entry
+
+    def __delitem__(self, path):
+        del self._shelf[self._key(path)]
+
+    def __iter__(self):
+        return iter(self._shelf.keys())
+
+    def __len__(self):
+        return len(self._shelf)
+
+    def get(self, path, default=None):
+        return self._shelf.get(self._key(path), default)
+
+    def pop(self, path):
+        entry = self[path]
+        del self[path]
+        return entry
+
+    def close(self):
+        if self._shelf is not None:
+            self._shelf.close()
+            self._shelf = None
+
+    def _key(self, path):
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        return path
@@ -19,12 +19,19 @@
 
 from __future__ import print_function
 
+from itertools import chain
+import errno
+import os
+import sys
+import time
+
 from click import (
+    Choice,
+    IntRange,
     Path,
     argument,
     command,
     confirm,
-    echo_via_pager,
     get_terminal_size,
     group,
     option,
@@ -33,13 +40,51 @@ from click import (
 )
 
 
+from logger import LEVELS
+import timing
+
+
 @group()
 @version_option(version='1.0.0') # TODO: read the version from somewhere
+@option('--log-level', type=Choice(LEVELS), metavar='LEVEL',
+        help='Log messages at LEVEL (%s) and above.' % ', '.join(LEVELS))
+@option('--profile', is_flag=True,
+        help='Print the time spent in each stage when done.')
+@option('--profile-dump', type=Path(dir_okay=False), metavar='PATH',
+        help='Profile with cProfile and save the statistics to PATH, '
+             'for pstats.')
 @pass_context
-def cli(ctx):
+def cli(ctx, log_level, profile, profile_dump):
     """Command line interface entry point."""
     # TODO: gets the program name wrong
-    pass
+    if log_level is not None:
+        ctx.obj['configuration']['log']['level'] = log_level
+    if profile or profile_dump:
+        _profile(ctx, profile_dump)
+
+
+def _profile(ctx, path=None):
+    """Times the stages of the command, and profiles it if there is a
+    path to save the statistics to, printing the times when it is done.
+    """
+    timing.enable()
+    start = time.time()
+    profiler = None
+    if path is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def report():
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(path)
+        print('%s\n%-16s %8s %10.3f' % (timing.report(), 'total', '',
+                                        time.time() - start),
+              file=sys.stderr)
+        if profiler is not None:
+            print('Profile saved to %s' % path, file=sys.stderr)
+    ctx.call_on_close(report)
 
 
 @cli.command(options_metavar='[-pd | --path | --default]',
@@ -75,7 +120,8 @@ def fields(ctx):
     print(ret.message)
 
 
-@cli.command(options_metavar='[-ait | --author | --isbn | --table]',
+@cli.command(options_metavar='[-ait | --author | --isbn | --table] '
+                             '[--limit N] [--offset N]',
              add_help_option=False)
 @option('-a', '--author',
         help='Show a list of matching authors',
@@ -86,9 +132,15 @@ def fields(ctx):
 @option('-t', '--table',
         help='Print the matches in a table.',
         is_flag=True)
+@option('--limit',
+        help='Show at most N matches.',
+        type=IntRange(min=0), metavar='N')
+@option('--offset',
+        help='Skip the first N matches.',
+        type=IntRange(min=0), metavar='N')
 @argument('query', nargs=-1, metavar='<query>...')
 @pass_context
-def list(ctx, author, isbn, table, query):
+def list(ctx, author, isbn, table, limit, offset, query):
     """Queries the library.
 
     \b
@@ -101,6 +153,9 @@ def list(ctx, author, isbn, table, query):
     \b
       root list -i
         -> All known titles with ISBNs.
+    \b
+      root list --limit 20 --offset 40
+        -> The third page of 20 titles.
     """
     arguments = {
             'list': True,
@@ -110,50 +165,145 @@ def list(ctx, author, isbn, table, query):
               '-a': author,
         '--author': author,
               '-i': isbn,
-          '--isbn': isbn
+          '--isbn': isbn,
+         '--limit': limit,
+        '--offset': offset,
+        '--stream': True
     }
     configuration = ctx.obj['configuration']
     ret, err = ctx.obj['factory'](arguments, configuration).execute()
     if err:
         print(err.reason)
         return
-    lines = ret.message.count('\n')
-    _, height = get_terminal_size()
-    # page if results are longer then a screen
-    if lines > height:
-        echo_via_pager(ret.message)
-    else:
-        print(ret.message)
+    lines = ret.message
+    if isinstance(lines, basestring):
+        # answered by the server
+        lines = iter(lines.split('\n'))
+    _echo_lines(lines)
 
 
-@cli.command(options_metavar='', add_help_option=False)
+def _echo_lines(lines):
+    """Prints lines as they come. If they are for a terminal, and there
+    turn out to be more than a screenful, the rest go through the pager.
+    """
+    try:
+        if not sys.stdout.isatty():
+            for line in lines:
+                print(line)
+            return
+        _, height = get_terminal_size()
+        screen = []
+        for line in lines:
+            screen.append(line)
+            if len(screen) > height:
+                _page(chain(screen, lines))
+                return
+        for line in screen:
+            print(line)
+    except IOError, e:
+        # the reader went away, as with root list | head
+        if e.errno != errno.EPIPE:
+            raise
+
+
+def _page(lines):
+    """Writes lines to $PAGER, or less, until they run out or the pager
+    is quit.
+    """
+    import subprocess
+    encoding = sys.stdout.encoding or 'utf-8'
+    environment = dict(os.environ)
+    environment.setdefault('LESS', 'FRX')
+    pager = subprocess.Popen(os.environ.get('PAGER') or 'less', shell=True,
+                             stdin=subprocess.PIPE, env=environment)
+    try:
+        for line in lines:
+            if isinstance(line, unicode):
+                line = line.encode(encoding, 'replace')
+            pager.stdin.write(line + '\n')
+        pager.stdin.close()
+    except IOError, e:
+        if e.errno not in (errno.EPIPE, errno.EINVAL):
+            raise
+    except KeyboardInterrupt:
+        pass
+    pager.wait()
+
+
+@cli.command(options_metavar='[-j N | --jobs N] [--prune-all]',
+             add_help_option=False)
+@option('-j', '--jobs',
+        help='Read books in N processes.',
+        type=int, metavar='N')
+@option('--prune-all', is_flag=True,
+        help='Remove every empty directory in the library.')
 @argument('query', nargs=-1, metavar='<query>...')
 @pass_context
-def update(ctx, query):
+def update(ctx, jobs, prune_all, query):
     """Updates the library."""
     configuration = ctx.obj['configuration']
     arguments = {'remote': True, '<query>': query}
     if confirm("Do you want to use a web service to fetch information for titles, \
 like author, ISBN, and description?"):
-        ctx.obj['factory'](arguments, configuration).execute()
+        ret, err = ctx.obj['factory'](arguments, configuration).execute()
+        print(err and err.reason or ret.message)
 
+    from files import transfer_mode
+    from transfer import DONE
     msg = '''If you update the library\n\
     - Files will be %s\n\
     - Empty Directories will%sbe removed\n\
 These settings can be configured in %s''' % (
-    configuration['import']['move'] and 'moved' or 'copied',
+    DONE.get(transfer_mode(configuration), 'copied'),
     configuration['import']['prune'] and ' ' or ' not ',
     configuration['system']['configfile']
 )
     print(msg)
     if confirm('Do you want to continue?'):
         print('\nBeginning update.')
-        arguments = {'update': True}
+        arguments = {'update': True, '--jobs': jobs,
+                     '--prune-all': prune_all}
         ctx.obj['factory'](arguments, configuration).execute()
     else:
         print('\nNot updating library.')
 
 
+@cli.command(options_metavar='[--inbox PATH] [-j N | --jobs N]',
+             add_help_option=False)
+@option('--inbox',
+        help='Import books which appear in PATH.',
+        type=Path(exists=True, file_okay=False), metavar='PATH')
+@option('-j', '--jobs',
+        help='Read books in N processes.',
+        type=int, metavar='N')
+@pass_context
+def watch(ctx, inbox, jobs):
+    """Keeps the library up to date until interrupted.
+
+    Books which are added to, changed in or removed from the library
+    directory are updated as they change. Books which appear in the
+    inbox are imported.
+    """
+    arguments = {'watch': True, '--inbox': inbox, '--jobs': jobs}
+    configuration = ctx.obj['configuration']
+    ret, err = ctx.obj['factory'](arguments, configuration).execute()
+    print(err and err.reason or ret.message)
+
+
+@cli.command(options_metavar='', add_help_option=False)
+@pass_context
+def serve(ctx):
+    """Serves queries from memory until interrupted.
+
+    While the library is being served, list and fields are answered by
+    the server.
+    """
+    arguments = {'serve': True}
+    configuration = ctx.obj['configuration']
+    ret, err = ctx.obj['factory'](arguments, configuration).execute()
+    print(err and err.reason or ret.message)
+
+
 @cli.command(options_metavar='', add_help_option=False)
 @argument('command', metavar='<command>')
 @pass_context
@@ -172,18 +322,25 @@ def help(ctx, command):
         print('No such command: ' + command)
 
 
-@cli.command(name='import', options_metavar='', add_help_option=False)
+@cli.command(name='import', options_metavar='[-j N | --jobs N]',
+             add_help_option=False)
+@option('-j', '--jobs',
+        help='Read books in N processes.',
+        type=int, metavar='N')
 @argument('path', metavar='<path>', type=Path(exists=True))
 @pass_context
-def import_(ctx, path):
+def import_(ctx, jobs, path):
     """Imports new e-books.
 
     \b
    Examples:
       root import ~/Downloads/
         -> imports books from ~/Downloads/
+    \b
+      root import -j 4 ~/Downloads/
+        -> reads books in 4 processes
     """
-    arguments = {'import': True, '<path>': path}
+    arguments = {'import': True, '<path>': path, '--jobs': jobs}
     configuration = ctx.obj['configuration']
     res, err = ctx.obj['factory'](arguments, configuration).execute()
     if err:
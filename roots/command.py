@@ -17,83 +17,180 @@
 """Commands.
 """
 
-from os.path import isfile, exists, expanduser
+from os import sep
+from os.path import isfile, isdir, exists, expanduser, splitext
 from collections import namedtuple
-from texttable import Texttable
-import yaml
+from itertools import islice
+from bisect import bisect_right
+import heapq
+import signal
 
-from configuration import user_configuration, default_configuration
-from format import EpubFormat
-from isbndb import Service
+from configuration import default_configuration, file_configuration
 import storage
-import files
+import search
+import server
 import logger
+import timing
+
+# Commands import the modules only they use when they run, rather than
+# here, so that a quick query does not pay for loading them.
 
 
 
 Complete = namedtuple('Complete', 'message')
 Error = namedtuple('Error', 'reason')
 
-def command(arguments, configuration):
-    """Returns an appropriate command."""
+def command(arguments, configuration, library=None):
+    """Returns an appropriate command. Queries are answered by `library`
+    if it is given, otherwise by a running server if there is one, or
+    from storage.
+    """
+    if library is None and any(arguments.get(name)
+                               for name in server.COMMANDS) \
+            and server.running(configuration):
+        return Served(arguments, configuration)
+    if 'serve' in arguments and arguments['serve']:
+        return Serve(arguments, configuration)
     if 'import' in arguments and arguments['import']:
         return Import(arguments, configuration)
+    if 'watch' in arguments and arguments['watch']:
+        return Watch(arguments, configuration)
     if 'update' in arguments and  arguments['update']:
         return Update(arguments, configuration)
     if 'config' in arguments and arguments['config']:
         return Config(arguments, configuration)
     if 'list' in arguments and arguments['list']:
-        return List(arguments, configuration)
+        return List(arguments, configuration, library)
     if 'fields' in arguments and arguments['fields']:
-        return Fields(arguments, configuration)
+        return Fields(arguments, configuration, library)
     if 'remote' in arguments and arguments['remote']:
         return RemoteLookup(arguments, configuration)
 
 
 class BaseCommand(object):
     """Base command class."""
-    def __init__(self, arguments, configuration):
+    def __init__(self, arguments, configuration, library=None):
         self._arguments = arguments
         self._configuration = configuration
+        # anything with the query functions of storage
+        self._library = library or storage
         self.log = logger.get_logger(self.__class__.__name__, configuration)
 
     @property
     def name(self):
         return self.__class__.__name__
 
+    def _jobs(self):
+        """Returns the number of processes to read books with."""
+        return (self._arguments.get('--jobs')
+                or self._configuration['import']['jobs'])
+
+    def _progress(self, count, srcpath):
+        """Reports the progress of reading books."""
+        if count % 100 == 0:
+            self.log.debug('%d books read, at %s', count, srcpath)
+
+    def _record(self, name, execute):
+        """Calls `execute` with the metrics of the run, which are
+        written when it is over (see `metrics`).
+        """
+        import metrics
+        with metrics.record(name, self._configuration) as run:
+            ret, err = execute(run)
+            run.success = err is None
+            return ret, err
+
 
 # TODO: move into a separate module
-def books_as_tuple(configuration, restrict='title', select=None):
+def books_as_tuple(configuration, restrict='title', select=None,
+                   library=storage):
     return [(book['author'], book['title'], book['isbn'])
-            for book in _query(configuration, restrict, select)]
+            for book in _query(configuration, restrict, select, library)]
 
-def books_as_map(configuration, restrict='title', select=None):
-    return _query(configuration, restrict, select)
+def books_as_map(configuration, restrict='title', select=None,
+                 library=storage):
+    return _query(configuration, restrict, select, library)
 
-def _query(configuration, restrict='title', select=None):
-    books = storage.load(configuration, 'library')
+def _query(configuration, restrict='title', select=None, library=storage):
     if select is None:
-        return books
-    else:
-        return [book for book in books
-                if restrict in book.keys()
-                and select.upper()
-                in unicode(book[restrict]).upper()]
+        return list(library.load_books(configuration))
+    return list(library.query_books(configuration, restrict, select))
 
 
 class List(BaseCommand):
 
     def execute(self):
-        """Loads the library metadata and selects entries from it.
+        """Loads the library metadata and selects entries from it. Only
+        the results from `--offset` on, up to `--limit`, are listed. If
+        `--stream` is set, the message is an iterator which renders the
+        lines as they are read, rather than one string.
         """
-
+        if self._arguments.get('--limit') == 0:
+            return Complete(self._complete(iter(()))), None
         restrict, select = self._parse_query()
-        results = books_as_tuple(self._configuration, restrict, select)
-        if len(results) == 0:
-            return None, Error("No matches for %s." % select)
-        elif self._configuration['list']['table'] or self._arguments['-t']:
-            return Complete(self._print_results_table(results)), None
-        return Complete('\n'.join(self._print_results(results))), None
+        table = self._configuration['list']['table'] or self._arguments['-t']
+        # the authors are only known once every result has been read
+        authors = self._arguments['-a'] and not table
+        keys = None
+        if select is not None and ':' not in self._arguments['<query>'][0]:
+            keys = search.search(self._configuration, select, self.log)
+        if keys:
+            results = self._books(keys if authors else self._page(keys))
+        # fall back on looking through the library if the index is out
+        # of date, unless the results are past the page asked for
+        if keys and (results or self._arguments.get('--offset')):
+            ordered = True
+        else:
+            results = books_as_tuple(self._configuration, restrict, select,
+                                     self._library)
+            if len(results) == 0:
+                return None, Error("No matches for %s." % select)
+            ordered = False
+            if not authors:
+                results, ordered = self._sorted_page(results), True
+        if table:
+            lines = self._print_results_table(results)
+        else:
+            lines = self._print_results(results, ordered)
+        if authors:
+            lines = self._page(lines)
+        lines = timing.iterate('render', lines)
+        return Complete(self._complete(lines)), None
+
+    def _complete(self, lines):
+        """Returns the lines as the message, streamed or joined.
+        """
+        if self._arguments.get('--stream'):
+            return lines
+        return '\n'.join(lines)
+
+    def _books(self, keys):
+        """Returns the books stored under the keys, in order.
+        """
+        return [(book['author'], book['title'], book['isbn'])
+                for book in self._library.get_books(self._configuration,
+                                                    keys)]
+
+    def _page(self, items):
+        """Returns the items from `--offset` on, up to `--limit` of them,
+        from a list or an iterator.
+        """
+        offset = self._arguments.get('--offset') or 0
+        limit = self._arguments.get('--limit')
+        stop = None if limit is None else offset + limit
+        if isinstance(items, list):
+            return items[offset:stop]
+        return islice(items, offset, stop)
+
+    def _sorted_page(self, results):
+        """Returns the page of the results once sorted, without sorting
+        those after the page.
+        """
+        offset = self._arguments.get('--offset') or 0
+        limit = self._arguments.get('--limit')
+        if limit is None:
+            return sorted(results)[offset:]
+        return heapq.nsmallest(offset + limit, results)[offset:]
 
     def _parse_query(self):
         """Extract select and restrict operations from the query.
@@ -108,24 +205,26 @@ class List(BaseCommand):
                 return 'title', ' '.join(user_query)
         return None, None
 
-    def _print_results(self, results):
-        """Print author, title and ISBN depending on the option.
+    def _print_results(self, results, ordered=False):
+        """Yields author, title and ISBN depending on the option. Ordered
+        results are kept in order, others are sorted.
         """
-        buf = []
+        if not ordered:
+            results = sorted(results)
         if self._arguments['-a']:
             for author in sorted({result[0] for result in results}):
-                buf.append(author)
+                yield author
         elif self._configuration['list']['isbn'] or self._arguments['-i']:
-            for result in sorted(results):
-                buf.append("%s - %s - %s" % result)
+            for result in results:
+                yield "%s - %s - %s" % result
         else:
-            for result in sorted(results):
-                buf.append("%s - %s" % result[:2])
-        return buf
+            for result in results:
+                yield "%s - %s" % result[:2]
 
     def _print_results_table(self, results):
-        """Print results formatted in a table.
+        """Returns the lines of the results formatted in a table.
         """
+        from texttable import Texttable
         table = Texttable()
         table.set_chars(['-', '|', '+', '-'])
         table.set_deco(Texttable.BORDER | Texttable.HEADER | Texttable.VLINES)
@@ -143,21 +242,62 @@ class List(BaseCommand):
             if self._configuration['list']['isbn'] or self._arguments['-i']:
                 row += [isbn.encode('utf-8')]
             table.add_row(row)
-        return table.draw()
+        return iter(table.draw().split('\n'))
 
 
 class Fields(BaseCommand):
 
     def execute(self):
-        books = storage.load(self._configuration, 'library', self.log)
-        fields = set()
-        for book in books:
-            for field in book.keys():
-                if field[0] is not '_':
-                    fields.add(field)
+        fields = {field for field in
+                  self._library.fields(self._configuration, self.log)
+                  if field[0] != '_'}
         return Complete('\n'.join(fields)), None
 
 
+class Serve(BaseCommand):
+
+    def execute(self):
+        """Answers queries from the library, held in memory, until
+        interrupted.
+        """
+        try:
+            daemon = server.Server(self._configuration, command, self.log)
+        except Exception, e:
+            return None, Error(str(e))
+        self.log.debug('serving on %s', daemon.server_address)
+        signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            daemon.serve()
+        except KeyboardInterrupt:
+            pass
+        return Complete('Stopped serving.'), None
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def _count_transfers(run, engine):
+    run.counts['files_transferred'] = engine.files
+    run.counts['bytes_transferred'] = engine.bytes
+
+
+class Served(BaseCommand):
+
+    def execute(self):
+        """Sends the command to the server, or runs it here if the
+        server has gone away.
+        """
+        response = server.request(self._configuration, self._arguments)
+        if response is None:
+            return command(self._arguments, self._configuration,
+                           storage).execute()
+        message, reason = response
+        if reason is not None:
+            return None, Error(reason)
+        return Complete(message), None
+
+
 class Config(BaseCommand):
 
     def execute(self):
@@ -165,10 +305,11 @@ class Config(BaseCommand):
         """
         if self._arguments['-p'] or self._arguments['--path']:
             return Complete(self._configuration['system']['configfile']), None
+        import yaml
         if self._arguments['-d'] or self._arguments['--default']:
             configuration = default_configuration()
         else:
-            configuration = user_configuration()
+            configuration = file_configuration()
         configuration.pop('system')
         msg = yaml.dump(configuration, default_flow_style=False)
         return Complete(msg), None
@@ -179,62 +320,385 @@ class Update(BaseCommand):
     def execute(self):
         """Updates the library.
         """
-        books = []
-        directory = self._configuration['directory']
+        return self._record('update', self._update)
+
+    def _update(self, run):
+        import files
+        import journal
+        directory = files.encode_path(expanduser(
+            self._configuration['directory']))
         if not exists(directory):
             return None, Error('Cannot open library: %s' % directory)
-        moves, books = files.find_moves(self._configuration, directory)
+        journal.recover(self._configuration, self.log)
+        with self._load_cache() as cache:
+            return self._update_library(run, directory, cache)
+
+    def _update_library(self, run, directory, cache):
+        import files
+        import transfer
+        moves, books = files.find_moves(self._configuration, directory,
+                                        cache, self._jobs(),
+                                        progress=self._progress,
+                                        counts=run.counts)
         moved = 0
         # if the user has chosen the move option, they'll be renamed
         # according to their new author / title, otherwise just
         # update the database
-        if self._configuration['import']['move']:
-            moved = files.move_to_library(self._configuration, moves)
+        if files.transfer_mode(self._configuration) == 'move':
+            engine = files.transfer_engine(self._configuration, transfer.move)
+            moved = engine.run(moves)
+            files.report_transfers(engine)
+            _count_transfers(run, engine)
+            run.counts['transfers_failed'] += len(moves) - moved
+            files.update_cache(cache, moves)
             if self._configuration['import']['prune']:
-                files.prune(self._configuration)
-        # here we begin the database update
+                files.prune(self._configuration, engine.sources)
+        if self._arguments.get('--prune-all'):
+            files.prune(self._configuration)
+        # here we begin the database update; it is made even if no
+        # books were found, so that the records of deleted ones go
         found = len(books)
-        if found > 0:
-            storage.store(self._configuration, {'library': books}, self.log)
+        books = self._keep_remote_fields(books)
+        written, _ = storage.replace_books(self._configuration, books,
+                                           self.log)
+        run.counts['books_stored'] += written
+        search.replace_books(self._configuration, books, self.log)
 
         msg = 'Updated %d %s, moved %d.' % (
             found, found != 1 and 'books' or 'book', moved
         )
         return Complete(msg), None
 
+    def _keep_remote_fields(self, books):
+        """Returns the books with any fields which were filled in on
+        their records by a remote lookup, since those are not in the
+        files.
+        """
+        keys = [storage.book_key(book) for book in books]
+        try:
+            records = {storage.book_key(record): record for record in
+                       storage.get_books(self._configuration, keys, self.log)}
+        except Exception:
+            return books
+        merged = []
+        for key, book in zip(keys, books):
+            if key in records:
+                book = dict(book)
+                for field, value in records[key].iteritems():
+                    if not book.get(field):
+                        book[field] = value
+            merged.append(book)
+        return merged
+
+    def _load_cache(self):
+        """Opens the stat cache (see `cache.StatCache`), which is kept
+        next to the library.
+        """
+        from cache import StatCache
+        return StatCache(splitext(storage.library_path(
+            self._configuration))[0] + '.stat')
+
+
+class Watch(Update):
+
+    def execute(self):
+        """Keeps the library up to date with the books in its directory
+        as they change, and imports books which appear in the inbox,
+        until interrupted.
+        """
+        import files
+        import journal
+        import watch
+        directory = files.encode_path(expanduser(
+            self._configuration['directory']))
+        if not exists(directory):
+            return None, Error('Cannot open library: %s' % directory)
+        inbox = (self._arguments.get('--inbox')
+                 or self._configuration['watch']['inbox'])
+        directories = [directory]
+        if inbox:
+            inbox = files.encode_path(expanduser(inbox))
+            if not isdir(inbox):
+                return None, Error('Cannot open inbox: %s' % inbox)
+            directories.append(inbox)
+        journal.recover(self._configuration, self.log)
+        settings = self._configuration['watch']
+        watcher = watch.watcher(directories, settings['interval'])
+        self.log.debug('watching %s with %s', ', '.join(directories),
+                       watcher.__class__.__name__)
+        signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            # catch up with changes made since the last update
+            with self._load_cache() as cache:
+                self._sync(watch.changed(directory, cache), directory, cache)
+            if inbox:
+                self._import(inbox)
+            for paths in watch.batches(watcher, settings['debounce']):
+                if inbox and any(path.startswith(inbox) for path in paths):
+                    self._import(inbox)
+                # the cache is not held open, so that updates can run
+                with self._load_cache() as cache:
+                    self._sync(paths, directory, cache)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+        return Complete('Stopped watching.'), None
+
+    def _sync(self, paths, directory, cache):
+        """Reads the books at the changed paths in the library, and
+        removes those which are gone.
+        """
+        from format import EpubFormat
+        import files
+        import watch
+        prefix = directory.rstrip(sep) + sep
+        paths = [path for path in paths if path.startswith(prefix)]
+        for path in [path for path in paths if isdir(path)]:
+            paths.extend(watch.changed(path, cache))
+        books, gone = [], set()
+        for path in paths:
+            if isfile(path) and watch.is_book(path):
+                current = files.signature(path)
+                cached, old = cache.get(path, (None, None))
+                if current is None or cached == current:
+                    continue
+                try:
+                    book = EpubFormat(self._configuration).load(path)
+                except Exception, e:
+                    self.log.debug('cannot read %s: %s', path, e)
+                    continue
+                if book is None:
+                    continue
+                if old is not None:
+                    gone.add(storage.book_key(old))
+                books.append(book)
+                cache[path] = (current, book)
+            elif not exists(path):
+                # a directory which was removed or moved away takes its
+                # books with it
+                subtree = path.rstrip(sep) + sep
+                for key in [key for key in cache
+                            if key == path or key.startswith(subtree)]:
+                    _, old = cache.pop(key)
+                    gone.add(storage.book_key(old))
+        gone.difference_update(storage.book_key(book) for book in books)
+        if books:
+            books = self._keep_remote_fields(books)
+            storage.store_books(self._configuration, books, self.log)
+            search.index_books(self._configuration, books, self.log)
+        if gone:
+            storage.remove_books(self._configuration, gone, self.log)
+            search.remove_books(self._configuration, gone, self.log)
+        if books or gone:
+            self.log.debug('%d books changed, %d removed',
+                           len(books), len(gone))
+
+    def _import(self, inbox):
+        arguments = {'import': True, '<path>': inbox,
+                     '--jobs': self._arguments.get('--jobs')}
+        ret, err = Import(arguments, self._configuration).execute()
+        if err is not None:
+            self.log.error('cannot import %s: %s', inbox, err.reason)
+        else:
+            self.log.info('%s', ret.message)
+
 
 class Import(BaseCommand):
 
     def execute(self):
         """Imports new e-books.
         """
+        return self._record('import', self._import)
+
+    def _import(self, run):
+        import files
+        import journal
+        import pipeline
+        import transfer
         srcpath = self._arguments['<path>']
         if isfile(srcpath):
             return None, Error("Source path should not be a file: %s" % srcpath)
         directory = expanduser(self._configuration['directory'])
         if not exists(directory):
             return None, Error('Cannot open library: %s' % directory)
-        moves, books = files.find_moves(self._configuration,
-                                        self._arguments['<path>'])
-        count = files.move_to_library(self._configuration, moves)
-        if count > 0:
-            storage.update(self._configuration, 'library', books,
-                           lambda x, y: x + y, logger=self.log)
+        mode = self._configuration['import']['mode']
+        if mode not in transfer.MODES:
+            return None, Error('Unknown import mode: %s' % mode)
+        journal.recover(self._configuration, self.log)
+        engine = files.transfer_engine(self._configuration)
+        count = 0
+        with journal.Journal(self._configuration) as log:
+            def transfer_batch(batch):
+                moves = [(srcpath, dstpath) for srcpath, dstpath, _ in batch]
+                number = log.begin(moves, [book for _, _, book in batch])
+                moved = engine.run(moves)
+                books = [book for _, dstpath, book in batch
+                         if exists(dstpath)]
+                return number, len(moves), moved, books
+            # books are read, copied and stored at the same time, a
+            # batch at a time
+            for number, planned, moved, books in pipeline.run(
+                    self._batches(srcpath, run.counts), [transfer_batch]):
+                run.counts['transfers_failed'] += planned - moved
+                if moved > 0:
+                    run.counts['books_stored'] += storage.store_books(
+                        self._configuration, books, self.log)
+                    search.index_books(self._configuration, books, self.log)
+                log.commit(number)
+                count += moved
+        files.report_transfers(engine)
+        _count_transfers(run, engine)
         msg = 'Imported %d %s.' % (count, count != 1 and 'books' or 'book')
         return Complete(msg), None
 
+    def _batches(self, srcpath, counts=None):
+        """Yields lists of books to import, with their paths and
+        destinations, skipping copies of books already in the library if
+        books are hashed. Files are counted in `counts` (see
+        `files.plan`).
+        """
+        import files
+        hashes = None
+        if self._configuration['import']['hash']:
+            hashes = storage.content_hashes(self._configuration, self.log)
+        batch_size = self._configuration['import']['batch']
+        batch = []
+        for planned in files.plan(self._configuration, srcpath,
+                                  jobs=self._jobs(), hashes=hashes,
+                                  progress=self._progress, counts=counts):
+            batch.append(planned)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
 
 class RemoteLookup(BaseCommand):
 
     def execute(self):
-        """Looks up book data from ISBNDB"""
+        """Looks up book data from ISBNDB and merges it into the library.
+
+        Books are looked up in batches, in the order of their keys.
+        After each batch the changed records are written and the key of
+        the last book looked up is kept as a checkpoint, so that a run
+        which is interrupted, or stopped by the throttle, carries on
+        from where it stopped the next time it is run. If books have
+        been added or removed before the checkpoint since, it starts
+        again.
+        """
+        return self._record('lookup', self._lookup)
+
+    def _lookup(self, run):
+        from isbndb import Service
         restrict, select = self._parse_query()
-        books = books_as_map(self._configuration, restrict, select)
-        request = Service(self._configuration)
-        self.log.debug(books)
-        books = request.request(books)
-        self.log.debug(books)
-        return None, None
+        books = sorted(books_as_map(self._configuration, restrict, select),
+                       key=storage.book_key)
+        checkpoint_key = '%s:%s' % (restrict, select)
+        checkpoints = self._load_checkpoints()
+        checkpoint = checkpoints.get(checkpoint_key)
+        pending = books
+        if checkpoint is not None:
+            cursor, done = checkpoint
+            keys = [storage.book_key(book) for book in books]
+            position = bisect_right(keys, cursor)
+            if position == done:
+                pending = books[position:]
+            else:
+                # books were added or removed before the cursor, and
+                # those added would be skipped, so start again
+                self.log.debug('%d books before the checkpoint, not %d; '
+                               'starting again.', position, done)
+        self.log.debug('%d books to look up, %d already done.',
+                       len(pending), len(books) - len(pending))
+        with Service(self._configuration) as request:
+            return self._look_up(run, request, pending,
+                                 len(books) - len(pending), checkpoints,
+                                 checkpoint_key)
+
+    def _look_up(self, run, request, pending, done, checkpoints,
+                 checkpoint_key):
+        """Looks up the pending books a batch at a time. `done` is the
+        number of books before them.
+        """
+        from isbndb import Incomplete
+        batch_size = self._configuration['isbndb']['batch']
+        changed = 0
+        for start in xrange(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            try:
+                results, error = request.request(batch), None
+            except Incomplete, e:
+                results, error = e.results, e
+            changed += self._apply(run, batch[:len(results)], results)
+            if results:
+                last = batch[len(results) - 1]
+                self._store_checkpoints(checkpoints, checkpoint_key, (
+                    storage.book_key(last), done + start + len(results)))
+            if error is not None:
+                run.counts.update(request.counts())
+                return None, Error('Stopped after %d of %d books, %d updated '
+                                   '(%s).' % (start + len(results),
+                                              len(pending), changed, error))
+        # the query is complete, so the next run starts again
+        self._store_checkpoints(checkpoints, checkpoint_key, None)
+        run.counts.update(request.counts())
+        msg = 'Looked up %d %s, updated %d.' % (
+            len(pending), len(pending) != 1 and 'books' or 'book', changed)
+        return Complete(msg), None
+
+    def _apply(self, run, batch, results):
+        """Merges the results of a batch into the library. Returns the
+        number of books changed.
+        """
+        merged = [self._merge(local, remote)
+                  for local, remote in zip(batch, results)]
+        updates = [book for book, local in zip(merged, batch)
+                   if book != local]
+        if len(updates) > 0:
+            run.counts['books_stored'] += storage.store_books(
+                self._configuration, updates, self.log)
+            search.index_books(self._configuration, updates, self.log)
+        run.counts['books_looked_up'] += len(batch)
+        return len(updates)
+
+    def _merge(self, local, remote):
+        """Merges the data found for a book into its record. Fields
+        with 'local' precedence keep their value unless it is empty,
+        and other fields take the remote value unless that is empty.
+        The record keeps its key.
+        """
+        precedence = self._configuration['isbndb']['merge']
+        merged = dict(local)
+        for field, value in remote.iteritems():
+            if precedence.get(field, 'remote') == 'local':
+                if not local.get(field):
+                    merged[field] = value
+            elif value or field not in local:
+                merged[field] = value
+        if storage.book_key(merged) != storage.book_key(local):
+            merged['_key'] = storage.book_key(local)
+        return merged
+
+    def _load_checkpoints(self):
+        """Returns the key of the last book looked up by each
+        unfinished query, and the number of books up to it.
+        """
+        try:
+            checkpoints = storage.load(self._configuration,
+                                       'isbndb_checkpoint', self.log)
+        except Exception:
+            checkpoints = None
+        return checkpoints or {}
+
+    def _store_checkpoints(self, checkpoints, key, cursor):
+        if cursor is None:
+            checkpoints.pop(key, None)
+        else:
+            checkpoints[key] = cursor
+        storage.store(self._configuration,
+                      {'isbndb_checkpoint': checkpoints}, self.log)
 
     def _parse_query(self):
         """Extract select and restrict operations from the query."""
@@ -242,7 +706,7 @@ class RemoteLookup(BaseCommand):
         if user_query:
             if ':' in user_query[0]:
                 restrict, select = user_query[0].split(':')
-                return restrict, ' '.join([select] + user_query[1:])
+                return restrict, ' '.join([select] + list(user_query[1:]))
             else:
                 return 'title', ' '.join(user_query)
         return None, None
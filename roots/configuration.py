@@ -15,18 +15,32 @@
 # limitations under the License.
 
 """Configuration settings.
+
+The user configuration is resolved once per process. Since parsing YAML
+is the slowest part of starting up, the resolved configuration is also
+kept in a snapshot, which is used for as long as the configuration file
+and the defaults have not changed, so that yaml is not even imported.
 """
 
+from copy import deepcopy
 from os import path
-import yaml
+import errno
+import hashlib
+import marshal
+import os
 import re
 
+_SNAPSHOT = '~/.cache/roots/configuration.cache'
+
+_resolved = None
+
 
 def default_configuration():
     """Returns default configuration.
     """
     return {
         'library': 'library.db',
+        'engine': 'shelve',
         'directory': '~/Books',
         'debug': False,
         'import': {
@@ -40,12 +54,45 @@ def default_configuration():
             },
             'overwrite': False,
             'hash': False,
+            'mmap': False,
+            'mode': 'copy',
             'move': False,
-            'prune': True
+            'prune': True,
+            'jobs': 1,
+            'transfers': 4,
+            'batch': 100
         },
         'isbndb' : {
             'key' : None,
-            'limit' : None
+            'limit' : None,
+            'reserve': 50,
+            'batch': 50,
+            'merge': {
+                'title': 'local',
+                'author': 'local',
+                'isbn': 'local',
+                'keywords': 'remote',
+                'description': 'remote'
+            },
+            'url': 'http://isbndb.com/api/v2/yaml/',
+            'workers': 1,
+            'cache': {
+                'ttl': 30,
+                'negative_ttl': 1,
+                'size': 50000
+            }
+        },
+        'watch': {
+            'inbox': None,
+            'debounce': 1.0,
+            'interval': 5.0
+        },
+        'log': {
+            'level': 'DEBUG'
+        },
+        'metrics': {
+            'json': None,
+            'textfile': None
         },
         'list': {
             'table': False,
@@ -59,9 +106,24 @@ def default_configuration():
 
 
 def user_configuration():
-    """Returns user configuration.
+    """Returns user configuration. It is only built the first time it
+    is asked for, and shared afterwards.
+    """
+    global _resolved
+    if _resolved is None:
+        _resolved = _load_configuration()
+    return _resolved
+
+
+def file_configuration():
+    """Returns the configuration as the configuration file sets it,
+    without the changes made since to the shared one, such as those of
+    command line options.
     """
-    custom = {}
+    return _load_configuration()
+
+
+def _load_configuration():
     configuration = default_configuration()
     default_config_path = path.join(
         path.expanduser('~'), '.config/roots/config.yaml')
@@ -73,16 +135,66 @@ def user_configuration():
                 'configpath': path.dirname(path.abspath(config_path))
             }
             break
+    else:
+        return configuration
     try:
         with open(config_path) as config_file:
-            custom = yaml.safe_load(config_file)
+            content = config_file.read()
+    except IOError:
+        return configuration
+    stamp = (configuration['system']['configfile'],
+             path.getmtime(config_path),
+             hashlib.sha1(content).hexdigest(),
+             deepcopy(configuration))
+    snapshot = _read_snapshot()
+    if snapshot is not None and snapshot[0] == stamp:
+        return snapshot[1]
+    import yaml
+    try:
+        custom = yaml.safe_load(content)
     except Exception:
-        pass
-    if custom is not None:
+        custom = None
+    if isinstance(custom, dict):
         configuration = _update(configuration, custom)
+    _write_snapshot((stamp, configuration))
     return configuration
 
 
+def _read_snapshot():
+    """Returns the snapshot of the last configuration which was built,
+    with the stamp of what it was built from, or None.
+    """
+    try:
+        with open(path.expanduser(_SNAPSHOT), 'rb') as snapshot:
+            return marshal.load(snapshot)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _write_snapshot(snapshot):
+    """Writes a snapshot, unless it holds values which marshal cannot
+    keep or it cannot be written, in which case the configuration will
+    just be built again next time.
+    """
+    snapshot_path = path.expanduser(_SNAPSHOT)
+    try:
+        data = marshal.dumps(snapshot)
+    except ValueError:
+        return
+    try:
+        try:
+            os.makedirs(path.dirname(snapshot_path))
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        temporary = '%s.%d' % (snapshot_path, os.getpid())
+        with open(temporary, 'wb') as snapshot_file:
+            snapshot_file.write(data)
+        os.rename(temporary, snapshot_path)
+    except (IOError, OSError):
+        pass
+
+
 def _update(defaults, updates):
     """Updates a nested dictionary
     """
@@ -96,7 +208,9 @@ def _update(defaults, updates):
 
 
 def compile_regex(configuration):
-    """Compiles regexes in the configuration
+    """Compiles the regexes of `import.replacements` in place. Cleaning
+    paths does not need this, since `paths.sanitiser` compiles them the
+    first time a path is cleaned.
     """
     replacements = configuration['import']['replacements']
     configuration['import']['replacements'] = {
@@ -19,97 +19,291 @@
 
 from __future__ import print_function
 
-from os import walk, makedirs, rmdir
+from os import walk, listdir, rmdir, stat, sep
 from os.path import (
     join,
-    isfile,
+    abspath,
     dirname,
-    basename,
+    isfile,
     exists,
     samefile,
     expanduser
 )
-from shutil import copy2 as _copy, move as _move
+from multiprocessing import Pool
+from collections import Counter
+from contextlib import contextmanager
+import errno
 from format import EpubFormat
+import paths
+import timing
+import transfer
+
+# paths are read this many at a time
+_READ_CHUNK = 256
 
+_COUNTS = ('files_scanned', 'files_parsed', 'files_cached', 'files_skipped',
+           'files_failed')
 
-def find_moves(configuration, rootpath):
-    """Determines the files to be moved and their destinations.
+
+def find_moves(configuration, rootpath, cache=None, jobs=1, hashes=None,
+               progress=None, counts=None):
+    """Determines the files to be moved and their destinations, as
+    lists of moves and of books (see `plan`).
     """
-    # TODO: needs a callback to update the user
-    library = expanduser(configuration['directory'])
     moves, books = [], []
-    for basepath, _, filenames in walk(rootpath):
-        for filename in filenames:
-            try:
-                if not filename.lower().endswith(".epub"):
-                    continue
-                srcpath = join(basepath, filename)
-                book = EpubFormat(configuration).load(srcpath)
-                if book is None:
-                    continue
-                dstdir = join(library, _clean_path(configuration, book['author']))
-                dstfile = _clean_path(configuration, book['title'] + '.epub')
-            except Exception, e:
-                if len(e.args) > 0:
-                    print("Not importing %s because " +
-                          str(e.args[0]).lower() % srcpath)
+    for srcpath, dstpath, book in plan(configuration, rootpath, cache, jobs,
+                                       hashes, progress, counts):
+        if dstpath is not None:
+            moves.append((srcpath, dstpath))
+        books.append(book)
+    return moves, books
+
+def plan(configuration, rootpath, cache=None, jobs=1, hashes=None,
+         progress=None, counts=None):
+    """Yields each book found under the root path, with its path and
+    the path it should be moved to, or None if it is where it should be.
+    Books are yielded as the tree is walked and read.
+
+    If a stat cache is given, files whose signature (see `signature`)
+    matches their entry are not read again. The cache is updated with
+    every file found, and entries for files which are gone are removed.
+    With more than one job, files are read by a pool of processes; the
+    results are the same, in the same order. If a hash index is given,
+    files with the same content as a book in it, or as another file
+    found, are skipped. If a progress function is given, it is called
+    with the number of files read so far and the path of each file. If
+    a Counter is given, the files scanned, parsed, cached (not read
+    again), skipped and failed are counted in it.
+    """
+    if counts is None:
+        counts = Counter()
+    # every count is reported, even if nothing was counted
+    counts.update(dict.fromkeys(_COUNTS, 0))
+    library = encode_path(expanduser(configuration['directory']))
+    update = samefile(rootpath, library)
+    found = set()
+    srcpaths = timing.iterate('walk', (
+        join(basepath, filename)
+        for basepath, _, filenames in walk(rootpath)
+        for filename in filenames
+        if filename.lower().endswith(".epub")))
+    for count, (srcpath, book) in enumerate(
+            _load_books(configuration, srcpaths, cache, jobs, counts), 1):
+        counts['files_scanned'] += 1
+        if progress is not None:
+            progress(count, srcpath)
+        try:
+            if isinstance(book, Exception):
+                raise book
+            if book is None:
+                counts['files_failed'] += 1
                 continue
-            dstpath = join(dstdir, dstfile)
-            overwrite = configuration['import']['overwrite']
-            if rootpath != library and not overwrite and isfile(dstpath):
-                print("Not importing %s because it already "
-                      "exists in the library." % srcpath)
+            dstdir = join(library, _clean_path(configuration, book['author']))
+            dstfile = _clean_path(configuration, book['title'] + '.epub')
+        except Exception, e:
+            counts['files_failed'] += 1
+            if len(e.args) > 0:
+                print("Not importing %s because " +
+                      str(e.args[0]).lower() % srcpath)
+            continue
+        if hashes is not None and '_sha_hash' in book:
+            if book['_sha_hash'] in hashes or book['_sha_hash'] in found:
+                print("Not importing %s because it is a copy of a book "
+                      "in the library." % srcpath)
+                counts['files_skipped'] += 1
                 continue
-            # if Update, all books, moves if path is wrong
-            if samefile(rootpath, library):
-                if not samefile(srcpath, dstpath):
-                    moves.append((srcpath, dstpath))
-                books.append(book)
-            # if Import, all new books and moves
-            elif not exists(dstpath) or not samefile(srcpath, dstpath):
-                moves.append((srcpath, dstpath))
-                books.append(book)
-    return moves, books
+        dstpath = join(dstdir, dstfile)
+        overwrite = configuration['import']['overwrite']
+        if rootpath != library and not overwrite and isfile(dstpath):
+            print("Not importing %s because it already "
+                  "exists in the library." % srcpath)
+            counts['files_skipped'] += 1
+            continue
+        # if Update, all books, moves if path is wrong
+        if update:
+            if exists(dstpath) and samefile(srcpath, dstpath):
+                dstpath = None
+            yield srcpath, dstpath, book
+        # if Import, all new books and moves
+        elif not exists(dstpath) or not samefile(srcpath, dstpath):
+            if '_sha_hash' in book:
+                found.add(book['_sha_hash'])
+            yield srcpath, dstpath, book
+
+def encode_path(path):
+    """Returns the path as a byte string, as the paths walked in the
+    library are, and as they are kept in the stat cache.
+    """
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    return path
+
+def signature(path):
+    """Returns the modification time, size and inode of a file, which
+    change whenever the file is replaced or rewritten, or None if the
+    file is gone.
+    """
+    try:
+        info = stat(path)
+    except OSError:
+        return None
+    return info.st_mtime, info.st_size, info.st_ino
+
+def update_cache(cache, moves):
+    """Moves stat cache entries to the destination of files which were
+    moved.
+    """
+    for srcpath, dstpath in moves:
+        if srcpath in cache and exists(dstpath) and not exists(srcpath):
+            _, book = cache.pop(srcpath)
+            current = signature(dstpath)
+            if current is not None:
+                cache[dstpath] = (current, book)
+
+def _load_books(configuration, srcpaths, cache, jobs, counts):
+    """Yields each path with the book read from it, or the exception
+    raised while reading it. Paths are read a chunk at a time, so books
+    are yielded before every path is known.
+    """
+    seen = set()
+    with _reader(configuration, jobs) as read:
+        for chunk in _chunks(srcpaths, _READ_CHUNK):
+            pending, fresh, signatures = chunk, {}, {}
+            if cache is not None:
+                pending = []
+                for srcpath in chunk:
+                    current = signature(srcpath)
+                    if current is None:
+                        # removed since the walk found it
+                        continue
+                    cached, book = cache.get(srcpath, (None, None))
+                    if cached == current and (
+                            not configuration['import']['hash']
+                            or '_sha_hash' in book):
+                        fresh[srcpath] = book
+                    else:
+                        pending.append(srcpath)
+                        signatures[srcpath] = current
+                chunk = [srcpath for srcpath in chunk
+                         if srcpath in fresh or srcpath in signatures]
+            seen.update(chunk)
+            counts['files_cached'] += len(fresh)
+            counts['files_parsed'] += len(pending)
+            loaded = read(pending)
+            for srcpath in chunk:
+                if srcpath in fresh:
+                    yield srcpath, fresh[srcpath]
+                    continue
+                book = next(loaded)
+                if cache is not None and isinstance(book, dict):
+                    cache[srcpath] = (signatures[srcpath], book)
+                yield srcpath, book
+    if cache is not None:
+        for path in set(cache).difference(seen):
+            del cache[path]
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+@contextmanager
+def _reader(configuration, jobs):
+    """Yields a function which reads books in order, in a pool of
+    processes if there is more than one job.
+    """
+    if jobs <= 1:
+        yield lambda srcpaths: (_read(configuration, srcpath)
+                                for srcpath in srcpaths)
+        return
+    pool = Pool(jobs, _init_worker, (configuration,))
+    try:
+        chunksize = max(1, _READ_CHUNK // (jobs * 4))
+        yield lambda srcpaths: timing.iterate(
+            'read', pool.imap(_load, srcpaths, chunksize))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+_worker_configuration = None
+
+def _init_worker(configuration):
+    global _worker_configuration
+    _worker_configuration = configuration
+
+def _load(srcpath):
+    return _read(_worker_configuration, srcpath)
+
+def _read(configuration, srcpath):
+    """Returns the book read from a path, or the exception raised while
+    reading it.
+    """
+    try:
+        return EpubFormat(configuration).load(srcpath)
+    except Exception, e:
+        return e
 
 def _clean_path(configuration, srcpath):
     """Takes a path (as a Unicode string) and makes sure that it is
     legal.
     """
-    replacements = configuration['import']['replacements']
-    for expression, replacement in replacements.iteritems():
-        srcpath = expression.sub(replacement, srcpath)
-    return srcpath.encode('utf-8')
+    return paths.clean(configuration, srcpath)
 
-def move_to_library(configuration, moves, move=_copy):
-    """Move files to the library
+def move_to_library(configuration, moves, move=None):
+    """Move files to the library, `import.transfers` at a time, and
+    returns the number moved. Files are copied, moved or linked
+    according to `import.mode`, or moved if `import.move` is set.
     """
-    if [configuration['import']['move']]:
-        move = _move
-    else:
-        move = _copy
-    moved = 0
-    for srcpath, destpath in moves:
-        destdir = dirname(destpath)
-        try:
-            if not exists(destdir):
-                makedirs(destdir)
-        except OSError:
-            print("Error creating path %s" % destdir)
-            continue
-        print("%s ->\n%s" % (basename(srcpath), destpath))
-        try:
-            move(srcpath, destpath)
-            moved += 1
-        except IOError, ioe:
-            print("Error importing %s (%s)" % srcpath, ioe.errno)
-    print('_move_to_library() -> %d' % moved)
+    engine = transfer_engine(configuration, move)
+    moved = engine.run(moves)
+    report_transfers(engine)
     return moved
 
-def prune(configuration):
-    """Removes empty directories
+def transfer_engine(configuration, move=None):
+    """Returns a `transfer.Transfer` which moves files to the library in
+    the configured way, for moving them a batch at a time.
+    """
+    if move is None:
+        move = transfer.MODES[transfer_mode(configuration)]
+    return transfer.Transfer(move, configuration['import']['transfers'])
+
+def transfer_mode(configuration):
+    """Returns the way books are put into the library, one of
+    `transfer.MODES`. `import.move` is the old way of choosing moves.
     """
-    for basepath, dirnames, filenames in walk(configuration['directory'],
-                                              topdown=False):
-        if len(dirnames) == 0 and len(filenames) == 0:
-            rmdir(basepath)
+    if configuration['import']['move']:
+        return 'move'
+    return configuration['import']['mode']
+
+def report_transfers(engine):
+    if engine.files > 0:
+        print(engine.report())
+
+def prune(configuration, directories=None):
+    """Removes empty directories. If directories are given, only they
+    and their ancestors in the library are checked, otherwise the whole
+    library is.
+    """
+    library = abspath(encode_path(expanduser(configuration['directory'])))
+    if directories is None:
+        for basepath, _, _ in walk(library, topdown=False):
+            if basepath != library and len(listdir(basepath)) == 0:
+                rmdir(basepath)
+        return
+    # deepest first, so that a parent is only checked once its
+    # children are gone
+    for directory in sorted(set(directories), key=len, reverse=True):
+        directory = abspath(directory)
+        while directory.startswith(library + sep):
+            try:
+                rmdir(directory)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    break
+            directory = dirname(directory)
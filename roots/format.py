@@ -19,6 +19,7 @@
 
 import zipfile
 import xml.etree.ElementTree as ET
+import mmap
 import re
 
 from urlparse import urljoin
@@ -26,6 +27,12 @@ from urllib import pathname2url as to_url
 from hashlib import sha1
 from HTMLParser import HTMLParser
 
+import timing
+import transfer
+
+# Dublin Core elements read from the OPF metadata
+_WANTED = ('title', 'creator', 'identifier')
+
 
 class BaseFormat(object):
 
@@ -75,7 +82,13 @@ class BaseFormat(object):
     def _search(self, element, tag_name, attribute=None):
         if element is None or tag_name is None:
             return
-        elements = [e for e in element.iter() if e.tag.endswith(tag_name)]
+        return self._select([e for e in element.iter()
+                             if e.tag.endswith(tag_name)], attribute)
+
+    def _select(self, elements, attribute=None):
+        """Return the text of the first element, or of the first with an
+        attribute whose value is `attribute`.
+        """
         if elements is None or len(elements) < 1:
             return
         elif attribute is not None:
@@ -88,6 +101,30 @@ class BaseFormat(object):
     def _unescape(self, string):
         return HTMLParser().unescape(string)
 
+    @timing.timed('hash')
+    def _hash(self, srcpath, use_mmap=False):
+        """Return the SHA-1 hash of a file, read in chunks so that large
+        files are never held in memory, or mapped if `use_mmap` is set.
+        """
+        digest = sha1()
+        with open(srcpath, 'rb') as srcfile:
+            if use_mmap:
+                try:
+                    mapped = mmap.mmap(srcfile.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+                except (ValueError, EnvironmentError):
+                    # empty files and some filesystems can't be mapped
+                    pass
+                else:
+                    try:
+                        digest.update(mapped)
+                    finally:
+                        mapped.close()
+                    return digest.hexdigest()
+            for chunk in iter(lambda: srcfile.read(transfer.CHUNK_SIZE), ''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
 
 class EpubFormat(BaseFormat):
 
@@ -97,16 +134,19 @@ class EpubFormat(BaseFormat):
     def load(self, srcpath):
         """Reads the metadata from an ebook file.
         """
-        content_xml = self._load_metadata(srcpath)
-        if content_xml is not None:
-            book = self._load_ops_data(content_xml)
-            if self._configuration['import']['hash']:
-                with open(srcpath, 'rb') as zipfile:
-                    book['_sha_hash'] = sha1(zipfile.read()).hexdigest()
-            return book
+        with timing.span('parse'):
+            metadata = self._load_metadata(srcpath)
+            if metadata is None:
+                return None
+            book = self._load_ops_data(metadata)
+        if self._configuration['import']['hash']:
+            book['_sha_hash'] = self._hash(
+                srcpath, self._configuration['import']['mmap'])
+        return book
 
     def _load_metadata(self, epub_filename):
-        """Reads an epub file and returns its OPS / OEBPS blob.
+        """Reads an epub file and returns the metadata elements from its
+        OPS / OEBPS blob.
         """
         if not zipfile.is_zipfile(epub_filename):
             raise Exception("Not importing %s because it is not a .epub file.",
@@ -123,14 +163,29 @@ class EpubFormat(BaseFormat):
             if full_path is None:
                 raise Exception("Could not locate a metadata file in %s.",
                                 epub_filename)
-            return ET.fromstring(epub_file.read(full_path.attrib["full-path"]))
+            with epub_file.open(full_path.attrib["full-path"]) as opf_file:
+                return self._read_metadata(opf_file)
 
-    def _load_ops_data(self, xml_data):
-        """Constructs a dictionary from OPS XML data.
+    def _read_metadata(self, opf_file):
+        """Returns the wanted Dublin Core elements of an OPF file, by
+        name. Parsing stops at the end of the metadata, so the manifest
+        and spine are never read.
+        """
+        metadata = {name: [] for name in _WANTED}
+        for _, element in ET.iterparse(opf_file):
+            if element.tag.endswith('metadata'):
+                break
+            for name in _WANTED:
+                if element.tag.endswith(name):
+                    metadata[name].append(element)
+        return metadata
+
+    def _load_ops_data(self, metadata):
+        """Constructs a dictionary from OPS metadata elements.
         """
-        title = self._search(xml_data, 'title')
-        author = self._author(self._search(xml_data, 'creator'))
-        isbn = self._isbn(self._search(xml_data, 'identifier', 'isbn'))
+        title = self._select(metadata['title'])
+        author = self._author(self._select(metadata['creator']))
+        isbn = self._isbn(self._select(metadata['identifier'], 'isbn'))
         if isbn is None:
             isbn = ''
         if author is None or title is None:
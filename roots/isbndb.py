@@ -17,58 +17,173 @@
 """Classes for interacting with the isbndb web service.
 """
 
+import atexit
 import yaml
 import requests
 
+from os.path import splitext
+from contextlib import contextmanager
 from datetime import date
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
 from string import digits
+from threading import Lock
+from weakref import WeakSet
 
+try:
+    import fcntl
+except ImportError:
+    # no locking between processes where flock is not available
+    fcntl = None
+
+from cache import ResponseCache
 import storage
+import timing
 import logger
 
 Rate = namedtuple('Rate', ['limit', 'date'])
 
+_URL = 'http://isbndb.com/api/v2/yaml/'
+
+
+class Incomplete(Exception):
+    """Raised when a list of books could not all be looked up. `results`
+    are the books looked up before the one which failed, in order.
+    """
+    def __init__(self, results, error):
+        Exception.__init__(self, str(error))
+        self.results = results
+        self.error = error
+
+# throttles with requests to return when the process exits
+_throttles = WeakSet()
+
+
+def _release_throttles():
+    for throttle in list(_throttles):
+        throttle.release()
+
 class Service(object):
     """Provides e-book information by claaing the isbndb api.
     """
     class Throttle(object):
         """Enforces rate-throttling behaviour to limit excessive api calls.
+
+        Requests are reserved from the daily rate in blocks, and counted
+        in memory until the block is used. Unused requests are returned
+        by `release`, which is called when the process exits. The stored
+        rate is only changed while holding a lock file, so processes
+        sharing a library cannot use more than the limit between them.
         """
         def __init__(self, configuration):
             self._configuration = configuration
             self.log = logger.get_logger(self.__class__.__name__, configuration)
-            limit = configuration['isbndb']['limit']
-            today = date.today()
-            try:
-                db = storage.load(configuration, 'isbndb')
-                self._rate = db['rate']
-                if self._rate.date < date.today():
-                    self.log.debug("Resetting limit, expired %s", self._rate.date)
-                    self._rate = Rate(limit, today)
-            except:
-                self._rate = Rate(limit, today)
-            if self._rate is not None:
+            self._lock = Lock()
+            self._limit = configuration['isbndb']['limit']
+            self._block = max(1, configuration['isbndb'].get('reserve') or 1)
+            self._reserved = 0
+            # the day the reserved requests were taken from
+            self._reserved_on = None
+            if self._limit is not None:
+                rate = self._load_rate(date.today())
                 self.log.debug('%s ISBNDB requests permitted on %s.',
-                               self._rate.limit, self._rate.date)
+                               rate.limit, rate.date)
+                if not _throttles:
+                    atexit.register(_release_throttles)
+                _throttles.add(self)
             else:
                 self.log.debug('ISBNDB requests not limited.')
 
+        def _load_rate(self, today):
+            """Returns the rate remaining today."""
+            try:
+                db = storage.load(self._configuration, 'isbndb')
+                rate = db['rate']
+                if rate.date < today:
+                    self.log.debug("Resetting limit, expired %s", rate.date)
+                    rate = Rate(self._limit, today)
+                return rate
+            except:
+                return Rate(self._limit, today)
+
         def check(self):
             """Throws an exception if the throttle rate has been exhausted.
+            Safe to call from several threads: each call uses exactly one
+            request from the rate.
             """
-            if self._rate is not None:
-                if self._rate.limit > 0:
-                    new_limit = self._rate.limit - 1
-                    storage.store(self._configuration, {
-                        'isbndb': {
-                            'rate': Rate(limit=new_limit, date=date.today())
-                        }
-                    })
-                else:
+            if self._limit is None:
+                return
+            with self._lock:
+                if self._reserved_on != date.today():
+                    # yesterday's requests are not today's to use
+                    self._reserved = 0
+                if self._reserved <= 0:
+                    self._reserve()
+                if self._reserved <= 0:
                     # TODO: exception?
                     raise Exception("Calls to ISBNDB are throttled. "
                                     "Check the configuration.")
+                self._reserved -= 1
+
+        def release(self):
+            """Returns unused reserved requests to the daily rate they
+            were taken from. Requests reserved before midnight are
+            dropped, since the rate has been reset since.
+            """
+            with self._lock:
+                if self._reserved <= 0:
+                    return
+                with self._lock_file():
+                    rate = self._load_rate(date.today())
+                    if rate.date == self._reserved_on:
+                        self._store_rate(Rate(rate.limit + self._reserved,
+                                              rate.date))
+                        self.log.debug('Returned %d ISBNDB requests.',
+                                       self._reserved)
+                self._reserved = 0
+
+        def remaining(self):
+            """Returns the requests left today, including those reserved
+            but unused, or None if requests are not limited.
+            """
+            if self._limit is None:
+                return None
+            with self._lock:
+                rate = self._load_rate(date.today())
+                if rate.date != self._reserved_on:
+                    return rate.limit
+                return rate.limit + self._reserved
+
+        def _reserve(self):
+            """Takes a block of requests from the daily rate.
+            """
+            with self._lock_file():
+                rate = self._load_rate(date.today())
+                claimed = min(self._block, rate.limit)
+                if claimed > 0:
+                    self._store_rate(Rate(rate.limit - claimed, rate.date))
+            self.log.debug('Reserved %d of %d ISBNDB requests.',
+                           claimed, rate.limit)
+            self._reserved += claimed
+            self._reserved_on = rate.date
+
+        def _store_rate(self, rate):
+            storage.store(self._configuration, {'isbndb': {'rate': rate}})
+
+        @contextmanager
+        def _lock_file(self):
+            """Holds an exclusive lock on a file next to the library.
+            """
+            path = splitext(storage.library_path(self._configuration))[0]
+            with open(path + '.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
 
     _blacklist = set(['and', 'of', 'is', 'but', 'for', 'or', 'nor' 'from',
                       'by', 'on', 'at', 'to', 'a', 'an', 'the', 'up'])
@@ -76,48 +191,135 @@ class Service(object):
     def __init__(self, configuration):
         self._configuration = configuration
         api_key = configuration['isbndb']['key']
-        self._request_base = 'http://isbndb.com/api/v2/yaml/' + api_key
+        url = configuration['isbndb'].get('url') or _URL
+        self._request_base = url + api_key
         self._throttle = self.Throttle(configuration)
+        self._workers = max(1, configuration['isbndb'].get('workers') or 1)
+        # connections are kept alive and shared between the workers
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self._workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._cache = self._response_cache(configuration)
+        self._requests = 0
+        self._requests_lock = Lock()
         self.log = logger.get_logger(self.__class__.__name__, configuration)
 
     def request(self, books):
         """Given a list of books, returns an updated list of
-        books.
+        books. Books are looked up concurrently if more than one worker
+        is configured; the results are in the same order. If a book
+        cannot be looked up, `Incomplete` is raised with the results
+        before it.
         """
         results = []
-        for book in books:
-            self._throttle.check()
-            response, err = self._http_request(book['isbn'])
-            if err:
-                response, err = self._http_request(
-                    book['title'].replace(' ', '_').lower())
-            if err:
-                results.append(book)
-                continue
-            data = response['data'][0]
-            results.append({
-                      'title': data['title'],
-                     'author': self._author(data),
-                       'isbn': data['isbn13'],
-                   'keywords': self._keywords(data),
-                'description': data['summary']
-            })
-        return results
+        pool = None
+        try:
+            if self._workers <= 1 or len(books) <= 1:
+                lookups = (self._lookup(book) for book in books)
+            else:
+                pool = ThreadPool(min(self._workers, len(books)))
+                lookups = pool.imap(self._lookup, books, chunksize=1)
+            try:
+                for result in lookups:
+                    results.append(result)
+            except Exception, e:
+                raise Incomplete(results, e)
+            return results
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def close(self):
+        """Returns the unused requests of the throttle and closes the
+        response cache, once the run is over.
+        """
+        self._throttle.release()
+        if self._cache is not None:
+            self._cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def counts(self):
+        """Returns the number of requests sent, of responses found and
+        not found in the cache, and of requests left today.
+        """
+        counts = {'isbndb_requests': self._requests}
+        if self._cache is not None:
+            counts['isbndb_cache_hits'] = self._cache.hits
+            counts['isbndb_cache_misses'] = self._cache.misses
+        remaining = self._throttle.remaining()
+        if remaining is not None:
+            counts['isbndb_quota_remaining'] = remaining
+        return counts
+
+    def _response_cache(self, configuration):
+        """Returns the cache of responses kept next to the library, or
+        None if caching is not configured.
+        """
+        settings = configuration['isbndb'].get('cache')
+        if not settings or not settings['size']:
+            return None
+        path = splitext(storage.library_path(configuration))[0] + '.cache'
+        return ResponseCache(path, settings['ttl'], settings['negative_ttl'],
+                             settings['size'])
+
+    def _lookup(self, book):
+        """Returns a book updated with data from the service, or the book
+        unchanged if nothing was found.
+        """
+        response, err = self._http_request(book['isbn'])
+        if err:
+            response, err = self._http_request(
+                book['title'].replace(' ', '_').lower())
+        if err:
+            return book
+        data = response['data'][0]
+        return {
+                  'title': data['title'],
+                 'author': self._author(data),
+                   'isbn': data['isbn13'],
+               'keywords': self._keywords(data),
+            'description': data['summary']
+        }
 
     def _http_request(self, query):
         """Sends an http request."""
         if query is None or len(query) <= 0:
             return None, True
+        if self._cache is not None:
+            cached, response_data = self._cache.get(query)
+            if cached:
+                self.log.debug('Cached response for %s', query)
+                return response_data, response_data is None
+        response_data = self._fetch(query)
+        if self._cache is not None:
+            self._cache.put(query, response_data)
+        return response_data, response_data is None
+
+    @timing.timed('http')
+    def _fetch(self, query):
+        """Returns the response to a query, or None if there is no data
+        for it."""
+        self._throttle.check()
         request = '%s/book/%s' % (self._request_base, query)
         self.log.debug('Requesting %s', request)
-        response = requests.get(request)
+        with self._requests_lock:
+            self._requests += 1
+        response = self._session.get(request)
         status = response.status_code
         if status != 200:
             self.log.debug('Response from server was %d.', status)
-            return None, True
+            return None
         response_data = yaml.load(response.text)
         self.log.debug('Response: %s', str(response_data))
-        return response_data, 'data' not in response_data.keys()
+        if 'data' not in response_data.keys():
+            return None
+        return response_data
 
     def _keywords(self, data):
         """Takes an underscore-separated list of keywords and
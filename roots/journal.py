@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Write-ahead journal for imports.
+
+Before a batch of books is transferred, the planned moves and the
+records to be written are appended to the journal as a line of JSON
+and synced to disk, and once the records are stored a commit is
+appended. Whenever no batch is outstanding the journal is truncated. If
+an import dies part way through, `recover` finds the uncommitted
+batches the next time the library is changed: files which were
+transferred completely have their records written, and partial copies
+are removed, so the library and its files agree again. Only files the
+import created are removed: a destination which already existed, as
+when overwriting, is left alone, and its record is only written if the
+file was replaced.
+
+A journal is locked for as long as its import runs, and `recover`
+leaves alone a journal it cannot lock, so that a run which starts while
+another is importing does not take that import for one which died.
+
+Paths are bytes, which need not be UTF-8, so they are kept in the
+journal decoded as Latin-1, which maps each byte to one character.
+"""
+
+from os import fsync, fstat, remove, stat
+from os.path import splitext, getsize
+from threading import Lock
+import errno
+import json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from files import signature
+import storage
+import search
+import transfer
+
+
+def journal_path(configuration):
+    """Returns the path of the journal for the library.
+    """
+    return splitext(storage.library_path(configuration))[0] + '.journal'
+
+
+class Journal(object):
+    """The journal of an import in progress.
+    """
+
+    def __init__(self, configuration):
+        self._path = journal_path(configuration)
+        # waits for any other import of the library to finish
+        self._file = _open_locked(self._path, 'a')
+        self._lock = Lock()
+        self._batches = 0
+        self._outstanding = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def begin(self, moves, books):
+        """Records a batch of moves, as (srcpath, dstpath) pairs, and the
+        books which will be stored once they are made. Moves whose
+        source has gone are left out, since they cannot be made. Returns
+        the number of the batch.
+        """
+        files, kept = [], []
+        for (srcpath, dstpath), book in zip(moves, books):
+            try:
+                size = getsize(srcpath)
+            except OSError:
+                continue
+            files.append({
+                'src': _encode(srcpath),
+                'dst': _encode(dstpath),
+                'size': size,
+                'existing': signature(dstpath)
+            })
+            kept.append(book)
+        entry = {'files': files, 'books': kept}
+        with self._lock:
+            self._batches += 1
+            entry['batch'] = self._batches
+            self._outstanding.add(self._batches)
+            self._file.write(json.dumps(entry) + '\n')
+            self._sync()
+            return self._batches
+
+    def commit(self, batch):
+        """Marks a batch as stored. When no batch is outstanding the
+        journal is emptied.
+        """
+        with self._lock:
+            self._outstanding.discard(batch)
+            if self._outstanding:
+                self._file.write(json.dumps({'commit': batch}) + '\n')
+            else:
+                self._file.truncate(0)
+            self._sync()
+
+    def close(self):
+        if self._file is not None:
+            # removed while still locked, so no one else can be using it
+            if fstat(self._file.fileno()).st_size == 0:
+                try:
+                    remove(self._path)
+                except OSError:
+                    pass
+            self._file.close()
+            self._file = None
+
+    def _sync(self):
+        self._file.flush()
+        fsync(self._file.fileno())
+
+
+def recover(configuration, logger=None):
+    """Finishes or undoes a batch left in the journal by an import which
+    did not complete. Returns the number of books stored and of partial
+    copies removed. A journal which is locked belongs to an import
+    still running, and is left alone.
+    """
+    path = journal_path(configuration)
+    journal = _open_locked(path, 'r', block=False)
+    if journal is None:
+        return 0, 0
+    try:
+        return _recover(configuration, logger, path, journal)
+    finally:
+        journal.close()
+
+
+def _recover(configuration, logger, path, journal):
+    entries, committed = [], set()
+    for line in journal:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # the batch was never begun
+            continue
+        if 'commit' in entry:
+            committed.add(entry['commit'])
+        else:
+            entries.append(entry)
+    books, removed = [], 0
+    for entry in entries:
+        if entry['batch'] in committed:
+            continue
+        for recorded, book in zip(entry['files'], entry['books']):
+            dstpath = _decode(recorded['dst'])
+            for partial in transfer.partial_paths(dstpath):
+                remove(partial)
+                removed += 1
+            current = signature(dstpath)
+            if current is None:
+                continue
+            existing = recorded['existing']
+            if existing is not None:
+                # not ours to remove; the move replaced it if it changed
+                # (JSON gives the recorded signature back as a list)
+                if current != tuple(existing):
+                    books.append(book)
+            elif current[1] == recorded['size']:
+                books.append(book)
+            else:
+                remove(dstpath)
+                removed += 1
+    if logger is not None:
+        logger.debug('recovered %d books and removed %d partial copies '
+                     'from %s', len(books), removed, path)
+    if books:
+        storage.store_books(configuration, books, logger)
+        search.index_books(configuration, books, logger)
+    remove(path)
+    return len(books), removed
+
+
+def _open_locked(path, mode, block=True):
+    """Opens a file and takes an exclusive lock on it. Returns None if
+    the file does not exist, or if `block` is not set and another
+    process holds the lock.
+    """
+    while True:
+        try:
+            locked = open(path, mode)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        if fcntl is None:
+            return locked
+        try:
+            fcntl.flock(locked, fcntl.LOCK_EX | (0 if block
+                                                  else fcntl.LOCK_NB))
+        except IOError, e:
+            locked.close()
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return None
+        # the holder may have removed the file before letting it go
+        try:
+            current = stat(path)
+        except OSError:
+            current = None
+        opened = fstat(locked.fileno())
+        if current is not None and (current.st_dev, current.st_ino) == (
+                opened.st_dev, opened.st_ino):
+            return locked
+        locked.close()
+
+
+def _encode(path):
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    return path.decode('latin-1')
+
+
+def _decode(path):
+    return path.encode('latin-1')
@@ -14,19 +14,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""Logging.
+
+Every logger shares one handler, which is added to a logger only once
+however many times it is asked for.
+"""
+
 import logging
 
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+_handler = logging.StreamHandler()
+_handler.setFormatter(logging.Formatter(
+    '%(asctime)s %(name)-12s %(levelname)8s %(message)s',
+    '%Y-%m-%d %H:%M:%S'))
+
+
 def get_logger(name, configuration):
-    """Returns a logger."""
+    """Returns a logger, at the level set by `log.level`.
+    """
     log = logging.getLogger(name)
+    level = 'DEBUG'
     if configuration is not None:
-        # TODO: read log level from config
-        pass
-    log.setLevel(logging.DEBUG)
-    # TODO: make handler configurable
-    handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(name)-12s %(levelname)8s %(message)s',
-        '%Y-%m-%d %H:%M:%S'))
-    log.addHandler(handler)
+        level = configuration.get('log', {}).get('level') or level
+    log.setLevel(getattr(logging, level.upper()))
+    if _handler not in log.handlers:
+        log.addHandler(_handler)
     return log
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run metrics.
+
+Import, update and lookup runs count what they did, and when they finish
+the counts are written for monitoring, if `metrics.json` or
+`metrics.textfile` is set:
+
+- `metrics.json` is a file which each run appends one line of JSON to.
+- `metrics.textfile` is the directory of the Prometheus node exporter's
+  textfile collector. Each run replaces the file for its command and
+  library there, named roots_<command>_<library hash>.prom.
+
+The time spent in each stage (see `timing`) is included.
+"""
+
+from os import rename, getpid
+from os.path import join, abspath, expanduser
+from collections import Counter
+from contextlib import contextmanager
+import hashlib
+import json
+import time
+
+import logger
+import storage
+import timing
+
+# what the counts mean, for the textfile
+HELP = {
+    'files_scanned': 'Books found.',
+    'files_parsed': 'Books read from their files.',
+    'files_cached': 'Books which had not changed since they were last read.',
+    'files_skipped': 'Books not imported because they were in the library.',
+    'files_failed': 'Books which could not be read.',
+    'files_transferred': 'Books copied, moved or linked.',
+    'transfers_failed': 'Books which could not be copied, moved or linked.',
+    'bytes_transferred': 'Bytes of the books copied, moved or linked.',
+    'books_stored': 'Book records written to the library.',
+    'books_looked_up': 'Books looked up on ISBNdb.',
+    'isbndb_requests': 'Requests sent to ISBNdb.',
+    'isbndb_cache_hits': 'ISBNdb responses found in the cache.',
+    'isbndb_cache_misses': 'ISBNdb responses not found in the cache.',
+    'isbndb_quota_remaining': 'ISBNdb requests left today.'
+}
+
+
+def enabled(configuration):
+    settings = configuration.get('metrics') or {}
+    return bool(settings.get('json') or settings.get('textfile'))
+
+
+@contextmanager
+def record(command, configuration):
+    """Yields the metrics of a run of a command, and writes them when
+    the run is over, whether or not it succeeded. The run succeeded if
+    `success` is set.
+    """
+    if not enabled(configuration):
+        yield Metrics(command)
+        return
+    timing.enable()
+    run = Metrics(command, abspath(storage.library_path(configuration)))
+    try:
+        yield run
+    finally:
+        run.finish()
+        write(run, configuration)
+
+
+def write(run, configuration):
+    """Writes the metrics of a run. Metrics which cannot be written are
+    logged and dropped, so that they never change how a command ends.
+    """
+    try:
+        _write(run, configuration)
+    except (IOError, OSError, ValueError), e:
+        logger.get_logger('Metrics', configuration).error(
+            'cannot write metrics: %s', e)
+
+
+def _write(run, configuration):
+    settings = configuration['metrics']
+    if settings.get('json'):
+        with open(expanduser(settings['json']), 'a') as metrics_file:
+            metrics_file.write(json.dumps(run.as_dict(), sort_keys=True))
+            metrics_file.write('\n')
+    if settings.get('textfile'):
+        library = _text(run.library).encode('utf-8')
+        path = join(expanduser(settings['textfile']), 'roots_%s_%s.prom' % (
+            run.command, hashlib.sha1(library).hexdigest()[:8]))
+        # the collector must never see a partly written file
+        temporary = '%s.%d' % (path, getpid())
+        with open(temporary, 'w') as metrics_file:
+            metrics_file.write(run.as_textfile())
+        rename(temporary, path)
+
+
+class Metrics(object):
+    """The counts and stage times of one run of a command.
+    """
+
+    def __init__(self, command, library=None):
+        self.command = command
+        self.library = library
+        self.counts = Counter()
+        self.success = False
+        self.start = time.time()
+        self.seconds = None
+        self.stages = {}
+        self._stages = timing.totals()
+
+    def finish(self):
+        """Ends the run, taking the stage times since it began.
+        """
+        self.seconds = time.time() - self.start
+        for name, (calls, seconds) in timing.totals().iteritems():
+            before_calls, before_seconds = self._stages.get(name, (0, 0.0))
+            if calls > before_calls:
+                self.stages[name] = (calls - before_calls,
+                                     seconds - before_seconds)
+
+    def as_dict(self):
+        return {
+            'command': self.command,
+            'library': _text(self.library),
+            'timestamp': self.start,
+            'seconds': self.seconds,
+            'success': self.success,
+            'counts': dict(self.counts),
+            'stages': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in self.stages.iteritems()}
+        }
+
+    def as_textfile(self):
+        """Returns the metrics in the Prometheus text format.
+        """
+        labels = 'command="%s",library="%s"' % (
+            self.command, _escape(_text(self.library).encode('utf-8')))
+        lines = []
+
+        def gauge(name, description, samples):
+            lines.append('# HELP roots_%s %s' % (name, description))
+            lines.append('# TYPE roots_%s gauge' % name)
+            for extra, value in samples:
+                lines.append('roots_%s{%s%s} %s' % (
+                    name, labels, extra, repr(float(value))))
+
+        gauge('run_timestamp_seconds', 'When the run started.',
+              [('', self.start)])
+        gauge('run_seconds', 'How long the run took.', [('', self.seconds)])
+        gauge('run_success', '1 if the run succeeded.',
+              [('', int(self.success))])
+        for name in sorted(self.counts):
+            gauge(name, HELP.get(name, name), [('', self.counts[name])])
+        if self.stages:
+            stages = sorted(self.stages.iteritems())
+            gauge('stage_seconds', 'Time spent in each stage.',
+                  [(',stage="%s"' % name, seconds)
+                   for name, (_, seconds) in stages])
+            gauge('stage_calls', 'Times each stage was entered.',
+                  [(',stage="%s"' % name, calls)
+                   for name, (calls, _) in stages])
+        return '\n'.join(lines) + '\n'
+
+
+def _text(path):
+    """Returns a path as Unicode, replacing bytes which are not UTF-8.
+    """
+    if isinstance(path, unicode):
+        return path
+    return path.decode('utf-8', 'replace')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n',
+                                                                   '\\n')
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Makes names safe to use in paths in the library.
+"""
+
+from collections import OrderedDict
+import re
+import sre_constants
+import sre_parse
+
+_sanitisers = {}
+
+
+class Sanitiser(object):
+    """Applies the `import.replacements` of a configuration to names.
+
+    Patterns which match a single character from a set are folded into
+    one translation table, applied first; the others are applied in
+    turn afterwards. Names are cached, since the same author name is
+    cleaned for every one of their books.
+    """
+
+    def __init__(self, replacements, size=4096):
+        self._table = {}
+        self._patterns = []
+        for expression, replacement in replacements.iteritems():
+            expression = re.compile(expression)
+            if _character_set(expression) and '\\' not in replacement:
+                replacement = unicode(replacement) or None
+                for character in map(unichr, range(128)):
+                    if expression.match(character):
+                        self._table.setdefault(ord(character), replacement)
+            else:
+                self._patterns.append((expression, replacement))
+        self._size = size
+        self._cache = OrderedDict()
+
+    def clean(self, name):
+        """Returns the name with the replacements made, encoded as
+        UTF-8.
+        """
+        try:
+            cleaned = self._cache.pop(name)
+        except KeyError:
+            cleaned = self._clean(name)
+            if len(self._cache) >= self._size:
+                self._cache.popitem(last=False)
+        self._cache[name] = cleaned
+        return cleaned
+
+    def _clean(self, name):
+        if not isinstance(name, unicode):
+            name = name.decode('utf-8')
+        name = name.translate(self._table)
+        for expression, replacement in self._patterns:
+            name = expression.sub(replacement, name)
+        return name.encode('utf-8')
+
+
+def _character_set(expression):
+    """Returns True if a pattern matches exactly one character from a
+    set of ASCII characters, like [<>:], so that it can be translated.
+    """
+    if expression.flags & (re.IGNORECASE | re.LOCALE | re.UNICODE):
+        return False
+    try:
+        parsed = list(sre_parse.parse(expression.pattern))
+    except sre_constants.error:
+        return False
+    if len(parsed) != 1:
+        return False
+    op, value = parsed[0]
+    if op == sre_constants.LITERAL:
+        return value < 128
+    if op != sre_constants.IN:
+        return False
+    for item, argument in value:
+        if item == sre_constants.LITERAL and argument < 128:
+            continue
+        if item == sre_constants.RANGE and argument[1] < 128:
+            continue
+        return False
+    return True
+
+
+def sanitiser(configuration):
+    """Returns the sanitiser for the replacements in a configuration,
+    compiling it the first time it is asked for.
+    """
+    replacements = configuration['import']['replacements']
+    cached = _sanitisers.get(id(replacements))
+    if cached is None or cached[0] is not replacements:
+        cached = (replacements, Sanitiser(replacements))
+        _sanitisers[id(replacements)] = cached
+    return cached[1]
+
+
+def clean(configuration, name):
+    """Takes a name (as a Unicode string) and makes sure that it is
+    legal in a path.
+    """
+    return sanitiser(configuration).clean(name)
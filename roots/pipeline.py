@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the stages of an import at the same time.
+
+Each stage runs in its own thread and hands its results to the next
+through a bounded queue, so that one stage can read books while the
+next copies them and the last stores them, and no stage gets more than
+a few items ahead of the one after it.
+"""
+
+from Queue import Queue, Full, Empty
+from threading import Thread, Event
+import sys
+
+_DONE = object()
+_POLL = 0.1
+
+
+class _Failed(object):
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+def run(source, stages, size=2):
+    """Yields the result of passing each item from `source` through
+    each of `stages` in turn. The source is iterated in one thread, and
+    each stage called in another, with at most `size` items waiting
+    between them. An exception in any thread is raised here.
+    """
+    stopped = Event()
+    queues = [Queue(size) for _ in range(len(stages) + 1)]
+    threads = [Thread(target=_produce, args=(source, queues[0], stopped))]
+    for i, stage in enumerate(stages):
+        threads.append(Thread(target=_consume,
+                              args=(stage, queues[i], queues[i + 1], stopped)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while True:
+            # a wait with a timeout can be interrupted by Ctrl-C
+            try:
+                item = queues[-1].get(timeout=_POLL)
+            except Empty:
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, _Failed):
+                raise item.exc_info[0], item.exc_info[1], item.exc_info[2]
+            yield item
+    finally:
+        stopped.set()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(_POLL)
+
+
+def _produce(source, output, stopped):
+    source = iter(source)
+    try:
+        for item in source:
+            if not _put(output, item, stopped):
+                return
+        _put(output, _DONE, stopped)
+    except Exception:
+        _put(output, _Failed(sys.exc_info()), stopped)
+    finally:
+        # a generator source cleans up now rather than when collected
+        if hasattr(source, 'close'):
+            source.close()
+
+
+def _consume(stage, source, output, stopped):
+    while not stopped.is_set():
+        try:
+            item = source.get(timeout=_POLL)
+        except Empty:
+            continue
+        if item is _DONE or isinstance(item, _Failed):
+            _put(output, item, stopped)
+            return
+        try:
+            result = stage(item)
+        except Exception:
+            _put(output, _Failed(sys.exc_info()), stopped)
+            return
+        if not _put(output, result, stopped):
+            return
+
+
+def _put(queue, item, stopped):
+    """Puts an item on a queue, waiting for room unless the pipeline is
+    stopped. Returns False if it was stopped.
+    """
+    while not stopped.is_set():
+        try:
+            queue.put(item, timeout=_POLL)
+            return True
+        except Full:
+            pass
+    return False
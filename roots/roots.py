@@ -16,11 +16,13 @@
 
 """
 Usage:
-  root import <path>
-  root update
-  root list [-ait] [<query>]...
+  root import [-j N] <path>
+  root update [-j N] [--prune-all]
+  root list [-ait] [--limit N] [--offset N] [<query>]...
   root fields
   root config [-p | -d | --path | --default]
+  root serve
+  root watch [--inbox PATH] [-j N]
   root test [<query>]...
   root help <command>
   root (-h | --help | --version)
@@ -31,15 +33,20 @@ Commands:
   list       Query the library.
   fields     Show fields that can be used in queries.
   config     Show the configuration.
+  serve      Answer queries from memory.
+  watch      Keep the library up to date.
   test       Test the new feature
   help       Show help for a sub-command.
 
 Options:
-  -h --help  Show this help.
-  --version  Show version.
+  -h --help            Show this help.
+  --version            Show version.
+  --log-level LEVEL    Log messages at LEVEL and above.
+  --profile            Print the time spent in each stage when done.
+  --profile-dump PATH  Save cProfile statistics to PATH.
 """
 
-from configuration import user_configuration, compile_regex
+from configuration import user_configuration
 from command import command
 from cli import cli
 
@@ -48,7 +55,6 @@ def main():
     """The entry point.
     """
     configuration = user_configuration()
-    compile_regex(configuration)
     cli(obj={
         'configuration': configuration,
         'factory': command
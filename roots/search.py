@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Full-text search index.
+
+An inverted index from terms to the books which contain them, kept in
+a shelve next to the library. Each term's postings are stored under
+their own key, so a query only reads the terms it asks for.
+"""
+
+from os.path import splitext
+from collections import Counter
+from math import log
+from whichdb import whichdb
+import re
+import shelve
+import unicodedata
+
+import storage
+
+# terms found in these fields count for more when ranking
+_WEIGHTS = {
+    'title': 3.0,
+    'author': 2.0,
+    'keywords': 1.5,
+    'description': 1.0,
+    'isbn': 1.0
+}
+
+_DOCUMENTS = 'documents'
+_TERM = 'term:'
+_DOCUMENT = 'doc:'
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def index_path(configuration):
+    """Returns the path of the index for the library.
+    """
+    return splitext(storage.library_path(configuration))[0] + '.idx'
+
+
+def exists(configuration):
+    return bool(whichdb(index_path(configuration)))
+
+
+def tokenise(text):
+    """Splits text into case- and accent-folded terms.
+    """
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = u''.join(c for c in text if not unicodedata.combining(c))
+    return _WORD.findall(text)
+
+
+def index_books(configuration, books, logger=None):
+    """Adds books to the index, re-indexing any whose terms changed.
+    Returns the number of books indexed. The books should already be in
+    the library: if there is no index yet, the whole library is indexed.
+    """
+    if not exists(configuration):
+        books = storage.load_books(configuration, logger)
+    index = _open(configuration, logger)
+    try:
+        return _index_books(index, books)
+    finally:
+        index.close()
+
+
+def remove_books(configuration, keys, logger=None):
+    """Removes books from the index.
+    """
+    index = _open(configuration, logger)
+    try:
+        return _remove_books(index, keys)
+    finally:
+        index.close()
+
+
+def replace_books(configuration, books, logger=None):
+    """Makes the index contain exactly the given books.
+    """
+    index = _open(configuration, logger)
+    try:
+        keep = {storage.book_key(book) for book in books}
+        gone = [key for key in index.get(_DOCUMENTS, ()) if key not in keep]
+        return _index_books(index, books), _remove_books(index, gone)
+    finally:
+        index.close()
+
+
+def search(configuration, query, logger=None):
+    """Returns the keys of the books matching every term in the query,
+    best match first, or None if there is no index.
+    """
+    if not exists(configuration):
+        return None
+    terms = set(tokenise(query))
+    if len(terms) == 0:
+        return []
+    index = shelve.open(index_path(configuration), flag='r')
+    try:
+        count = len(index.get(_DOCUMENTS, ()))
+        postings = []
+        for term in terms:
+            posting = index.get(_TERM + term.encode('utf-8'))
+            if not posting:
+                return []
+            postings.append(posting)
+    finally:
+        index.close()
+    # the rarest term bounds the results, so intersect from there
+    postings.sort(key=len)
+    matches = set(postings[0])
+    for posting in postings[1:]:
+        matches.intersection_update(posting)
+    scores = Counter()
+    for posting in postings:
+        idf = log(1.0 + float(count) / len(posting))
+        for key in matches:
+            scores[key] += posting[key] * idf
+    if logger is not None:
+        logger.debug('%d matches for %s', len(matches), query)
+    ranked = sorted(scores.iteritems(), key=lambda item: (-item[1], item[0]))
+    return [key for key, _ in ranked]
+
+
+def _terms(book):
+    """Returns the weighted frequency of each term in a book.
+    """
+    terms = Counter()
+    for field, weight in _WEIGHTS.iteritems():
+        value = book.get(field)
+        if not value:
+            continue
+        if isinstance(value, (set, frozenset, list, tuple)):
+            value = u' '.join(value)
+        for term in tokenise(value):
+            terms[term] += weight
+    return dict(terms)
+
+
+def _index_books(index, books):
+    documents = index.get(_DOCUMENTS, set())
+    changed = {}
+    for book in books:
+        key = storage.book_key(book)
+        terms = _terms(book)
+        record = _DOCUMENT + key
+        if key in documents and index[record] == terms:
+            continue
+        changed[key] = (index[record] if key in documents else {}, terms)
+        index[record] = terms
+        documents.add(key)
+    _post(index, changed)
+    if changed:
+        index[_DOCUMENTS] = documents
+    return len(changed)
+
+
+def _remove_books(index, keys):
+    documents = index.get(_DOCUMENTS, set())
+    changed = {}
+    for key in keys:
+        if key in documents:
+            changed[key] = (index[_DOCUMENT + key], {})
+            del index[_DOCUMENT + key]
+            documents.discard(key)
+    _post(index, changed)
+    if changed:
+        index[_DOCUMENTS] = documents
+    return len(changed)
+
+
+def _post(index, changed):
+    """Updates the postings for the terms of changed documents, given a
+    map of document keys to their old and new terms. Each term's
+    postings are rewritten once however many documents changed.
+    """
+    updates = {}
+    for key, (old, new) in changed.iteritems():
+        for term in set(old) | set(new):
+            updates.setdefault(term, {})[key] = new.get(term)
+    for term, keys in updates.iteritems():
+        name = _TERM + term.encode('utf-8')
+        posting = index.get(name, {})
+        for key, frequency in keys.iteritems():
+            if frequency is None:
+                posting.pop(key, None)
+            else:
+                posting[key] = frequency
+        if posting:
+            index[name] = posting
+        elif name in index:
+            del index[name]
+
+
+def _open(configuration, logger=None):
+    path = index_path(configuration)
+    if logger is not None:
+        logger.debug('indexing in %s', path)
+    return shelve.open(path)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Library server.
+
+`root serve` keeps the library in memory and answers queries on a Unix
+socket next to the library, so that a query does not have to read the
+whole library again. Requests and responses are single lines of JSON:
+the client sends the arguments of a command, and the server replies
+with its message or error.
+"""
+
+from os import remove, stat
+from os.path import splitext, exists
+from collections import OrderedDict
+from glob import glob
+from threading import Lock
+import errno
+import json
+import socket
+import SocketServer
+
+import storage
+
+# the commands the server answers
+COMMANDS = ('list', 'fields')
+
+_TIMEOUT = 5.0
+
+
+def socket_path(configuration):
+    """Returns the path of the socket for the library.
+    """
+    return splitext(storage.library_path(configuration))[0] + '.sock'
+
+
+def running(configuration):
+    return exists(socket_path(configuration))
+
+
+def request(configuration, arguments):
+    """Sends a command to the server. Returns its message and error, or
+    None if no server is listening or it did not answer, so that the
+    command can be run here instead.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(_TIMEOUT)
+    try:
+        client.connect(socket_path(configuration))
+        line = json.dumps({
+            'arguments': arguments,
+            'list': configuration['list']
+        })
+        client.sendall(line + '\n')
+        response = json.loads(client.makefile().readline())
+        return response['message'], response['error']
+    except (socket.error, socket.timeout, ValueError, KeyError):
+        return None
+    finally:
+        client.close()
+
+
+class Library(object):
+    """The books in a library, held in memory and read again whenever
+    the library changes. It can be queried in place of `storage`.
+    """
+
+    def __init__(self, configuration, logger=None):
+        self._configuration = configuration
+        self._logger = logger
+        self._lock = Lock()
+        self._stamp = None
+        self._books = OrderedDict()
+        self._fields = set()
+
+    def load_books(self, configuration, logger=None):
+        return iter(self._current().values())
+
+    def get_books(self, configuration, keys, logger=None):
+        books = self._current()
+        return (books[key] for key in keys if key in books)
+
+    def query_books(self, configuration, restrict, select, logger=None):
+        select = select.upper()
+        return (book for book in self._current().itervalues()
+                if restrict in book
+                and select in unicode(book[restrict]).upper())
+
+    def fields(self, configuration, logger=None):
+        self._current()
+        return set(self._fields)
+
+    def _current(self):
+        with self._lock:
+            stamp = self._files()
+            if stamp != self._stamp:
+                self._load()
+                self._stamp = stamp
+            return self._books
+
+    def _load(self):
+        if self._logger is not None:
+            self._logger.debug('loading the library')
+        books = OrderedDict()
+        fields = set()
+        for book in storage.load_books(self._configuration, self._logger):
+            books[storage.book_key(book)] = book
+            fields.update(book.keys())
+        self._books, self._fields = books, fields
+
+    def _files(self):
+        """Returns the modification times and sizes of the library's
+        files, which change whenever it is written.
+        """
+        stem = splitext(storage.library_path(self._configuration))[0]
+        stamp = []
+        for path in sorted(glob(stem + '.*')):
+            if path.endswith(('.sock', '.lock', '.cache')):
+                continue
+            try:
+                info = stat(path)
+            except OSError:
+                continue
+            stamp.append((path, info.st_mtime, info.st_size))
+        return stamp
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Answers commands on the library's socket until it is shut down.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, configuration, factory, logger=None):
+        self.configuration = configuration
+        self.factory = factory
+        self.logger = logger
+        self.library = Library(configuration, logger)
+        path = socket_path(configuration)
+        if exists(path):
+            if request(configuration, {'fields': True}) is not None:
+                raise Exception('The library is already being served '
+                                'on %s' % path)
+            remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+
+    def serve(self):
+        """Serves until shut down.
+        """
+        # read the library before the first query rather than during it
+        self.library.fields(self.configuration)
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            remove(self.server_address)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        try:
+            query = json.loads(self.rfile.readline())
+            arguments = query['arguments']
+            if not any(arguments.get(name) for name in COMMANDS):
+                raise Exception('Cannot serve %s' % ', '.join(arguments))
+            configuration = dict(server.configuration, list=query['list'])
+            ret, err = server.factory(arguments, configuration,
+                                      server.library).execute()
+            message = ret and ret.message
+            if message is not None and not isinstance(message, basestring):
+                # streamed lines are sent as one message
+                message = '\n'.join(message)
+            response = {
+                'message': message,
+                'error': err and err.reason
+            }
+        except Exception, e:
+            if server.logger is not None:
+                server.logger.exception('request failed')
+            response = {'message': None, 'error': str(e)}
+        self.wfile.write(json.dumps(response) + '\n')
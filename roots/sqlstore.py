@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""SQLite library engine.
+
+Author, title and ISBN are kept in indexed columns, other fields are
+kept in a JSON column. Selected with `engine: sqlite` in the
+configuration.
+"""
+
+from os.path import splitext, isfile
+import cPickle as pickle
+import json
+
+_COLUMNS = ('author', 'title', 'isbn')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS books ('
+    ' key TEXT PRIMARY KEY,'
+    ' author TEXT,'
+    ' title TEXT,'
+    ' isbn TEXT,'
+    ' extra TEXT)',
+    'CREATE INDEX IF NOT EXISTS books_author ON books (author COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS books_title ON books (title COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS books_isbn ON books (isbn)',
+    'CREATE TABLE IF NOT EXISTS hashes ('
+    ' hash TEXT PRIMARY KEY,'
+    ' key TEXT)',
+    'CREATE INDEX IF NOT EXISTS hashes_key ON hashes (key)',
+    'CREATE TABLE IF NOT EXISTS data ('
+    ' subject TEXT PRIMARY KEY,'
+    ' value BLOB)'
+)
+
+
+def database_path(library_path):
+    """Returns the path of the database used in place of the given
+    shelve library.
+    """
+    return splitext(library_path)[0] + '.sqlite'
+
+
+def exists(library_path):
+    return isfile(database_path(library_path))
+
+
+def connect(library_path):
+    """Opens the database, creating the schema if necessary.
+    """
+    # sqlite3 is only loaded by libraries which use it
+    import sqlite3
+    connection = sqlite3.connect(database_path(library_path))
+    connection.create_function('unicode_upper', 1, _upper)
+    for statement in _SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+def load(connection, subject):
+    row = connection.execute('SELECT value FROM data WHERE subject = ?',
+                             (subject,)).fetchone()
+    if row is not None:
+        return pickle.loads(str(row[0]))
+
+
+def store(connection, data):
+    connection.executemany(
+        'INSERT OR REPLACE INTO data (subject, value) VALUES (?, ?)',
+        [(subject, buffer(pickle.dumps(entry, -1)))
+         for subject, entry in data.iteritems()])
+
+
+def keys(connection):
+    return {row[0].encode('utf-8')
+            for row in connection.execute('SELECT key FROM books')}
+
+
+def load_books(connection):
+    for row in connection.execute(
+            'SELECT author, title, isbn, extra FROM books'):
+        yield _book(row)
+
+
+def hashes(connection):
+    return {row[0] for row in connection.execute('SELECT hash FROM hashes')}
+
+
+def get_book(connection, key):
+    row = connection.execute(
+        'SELECT author, title, isbn, extra FROM books WHERE key = ?',
+        (_text(key),)).fetchone()
+    if row is not None:
+        return _book(row)
+
+
+def query_books(connection, restrict, select):
+    """Yields the books whose field `restrict` contains `select`,
+    ignoring case.
+    """
+    if restrict in _COLUMNS:
+        field = restrict
+    else:
+        field = "json_extract(extra, '$.' || ?)"
+    pattern = u'%' + _escape(select) + u'%'
+    try:
+        pattern.encode('ascii')
+        # LIKE folds ASCII case itself, which is much cheaper than
+        # calling back into Python for every row
+        condition = "%s LIKE ? ESCAPE '\\'" % field
+    except UnicodeEncodeError:
+        condition = "unicode_upper(%s) LIKE unicode_upper(?) ESCAPE '\\'" % field
+    arguments = (pattern,) if restrict in _COLUMNS else (restrict, pattern)
+    for row in connection.execute(
+            'SELECT author, title, isbn, extra FROM books WHERE ' + condition,
+            arguments):
+        yield _book(row)
+
+
+def fields(connection):
+    """Returns the names of all fields used by any book.
+    """
+    names = set(_COLUMNS)
+    for row in connection.execute(
+            'SELECT DISTINCT json_each.key '
+            'FROM books, json_each(books.extra)'):
+        if row[0] != '_sets':
+            names.add(row[0])
+    return names
+
+
+def store_book(connection, key, book):
+    """Writes a book if it differs from the stored record. Returns True
+    if the record was written.
+    """
+    key = _text(key)
+    row = _row(key, book)
+    existing = connection.execute(
+        'SELECT key, author, title, isbn, extra FROM books WHERE key = ?',
+        (key,)).fetchone()
+    if existing is not None and tuple(existing) == row:
+        return False
+    connection.execute('DELETE FROM hashes WHERE key = ?', (key,))
+    connection.execute(
+        'INSERT OR REPLACE INTO books (key, author, title, isbn, extra) '
+        'VALUES (?, ?, ?, ?, ?)', row)
+    if book.get('_sha_hash'):
+        connection.execute(
+            'INSERT OR REPLACE INTO hashes (hash, key) VALUES (?, ?)',
+            (book['_sha_hash'], key))
+    return True
+
+
+def remove_book(connection, key):
+    key = _text(key)
+    connection.execute('DELETE FROM hashes WHERE key = ?', (key,))
+    return connection.execute('DELETE FROM books WHERE key = ?',
+                              (key,)).rowcount > 0
+
+
+def _row(key, book):
+    extra = {}
+    sets = []
+    for field, value in book.iteritems():
+        if field in _COLUMNS:
+            continue
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value)
+            sets.append(field)
+        extra[field] = value
+    if sets:
+        extra['_sets'] = sorted(sets)
+    return (key, book.get('author'), book.get('title'),
+            book.get('isbn'), json.dumps(extra, sort_keys=True))
+
+
+def _text(key):
+    """Returns a key (see `storage.book_key`) as it is kept in the
+    database.
+    """
+    if isinstance(key, str):
+        key = key.decode('utf-8')
+    return key
+
+
+def _book(row):
+    author, title, isbn, extra = row
+    book = json.loads(extra)
+    for field in book.pop('_sets', ()):
+        book[field] = set(book[field])
+    book.update({'author': author, 'title': title, 'isbn': isbn})
+    return book
+
+
+def _escape(string):
+    return (string.replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def _upper(string):
+    if string is None:
+        return None
+    return unicode(string).upper()
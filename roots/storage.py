@@ -15,21 +15,42 @@
 # limitations under the License.
 
 """Functions for working with the Library.
+
+Each book is stored as its own record under a stable key (see
+`book_key`), and the set of known keys is kept in a separate
+manifest, so that writing one book does not rewrite the catalogue.
+The library is a shelve by default; `engine: sqlite` selects the
+engine in `sqlstore`.
 """
 
-from os.path import join, isfile
-import pickle
+from os.path import join
+from contextlib import contextmanager
+from whichdb import whichdb
 import shelve
 
+import sqlstore
+import timing
+
+VERSION = 3
+
+_MANIFEST = 'manifest'
+_RECORD = 'book:'
+_HASH = 'hash:'
+
 
 def load(configuration, subject, logger=None):
     """Returns data from the library.
     """
-    library_path = join(configuration['system']['configpath'],
-                        configuration['library'])
+    if subject == 'library':
+        return list(load_books(configuration, logger))
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            return sqlstore.load(connection, subject)
+    library_path = _library_path(configuration)
     if logger is not None:
-        logger.debug('loading %s (exists: %s)', library_path, isfile(library_path))
-    if not isfile(library_path):
+        logger.debug('loading %s (exists: %s)', library_path,
+                     _exists(library_path))
+    if not _exists(library_path):
         raise Exception('Cannot open library: %s', library_path)
     try:
         library = shelve.open(library_path, flag='r')
@@ -42,12 +63,16 @@ def load(configuration, subject, logger=None):
 def store(configuration, data, logger=None):
     """Stores data in the library.
     """
-    library_path = join(configuration['system']['configpath'],
-                        configuration['library'])
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            sqlstore.store(connection, data)
+        return
+    library_path = _library_path(configuration)
     if logger is not None:
-        logger.debug('storing %s (exists: %s)', library_path, isfile(library_path))
-    if not isfile(library_path):
-        data['version'] = 1
+        logger.debug('storing %s (exists: %s)', library_path,
+                     _exists(library_path))
+    if not _exists(library_path):
+        data['version'] = VERSION
     library = shelve.open(library_path)
     for subject, entry in data.iteritems():
         library[subject] = entry
@@ -63,3 +88,343 @@ def update(configuration, subject, data, function, logger=None):
     if existing_data is not None:
         data = function(data, existing_data)
     store(configuration, {subject: data}, logger)
+
+
+def book_key(book):
+    """Returns the key a book is stored under: its ISBN, or its
+    content hash, or failing that its author and title. A book which
+    keeps its key when its metadata changes records it as `_key`.
+    """
+    if book.get('_key'):
+        key = book['_key']
+    elif book.get('isbn'):
+        key = u'isbn:' + book['isbn']
+    elif book.get('_sha_hash'):
+        key = u'sha1:' + book['_sha_hash']
+    else:
+        key = u'name:%s/%s' % (book['author'].lower(), book['title'].lower())
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return key
+
+
+def load_books(configuration, logger=None):
+    """Yields each book in the library. The library is read one record
+    at a time, and is migrated first if it was written by an earlier
+    version.
+    """
+    return timing.iterate('storage.load', _load_books(configuration, logger))
+
+
+def _load_books(configuration, logger=None):
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            for book in sqlstore.load_books(connection):
+                yield book
+        return
+    library_path = _library_path(configuration)
+    if logger is not None:
+        logger.debug('loading books from %s (exists: %s)', library_path,
+                     _exists(library_path))
+    if not _exists(library_path):
+        raise Exception('Cannot open library: %s', library_path)
+    if _needs_migration(library_path):
+        migrate(configuration, logger)
+    library = shelve.open(library_path, flag='r')
+    try:
+        for key in library.get(_MANIFEST, ()):
+            yield library[_RECORD + key]
+    finally:
+        library.close()
+
+
+def get_books(configuration, keys, logger=None):
+    """Yields the books stored under the given keys, in order, skipping
+    any which are not in the library.
+    """
+    return timing.iterate('storage.load',
+                          _get_books(configuration, keys, logger))
+
+
+def _get_books(configuration, keys, logger=None):
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            for key in keys:
+                book = sqlstore.get_book(connection, key)
+                if book is not None:
+                    yield book
+        return
+    library_path = _library_path(configuration)
+    if not _exists(library_path):
+        raise Exception('Cannot open library: %s', library_path)
+    if _needs_migration(library_path):
+        migrate(configuration, logger)
+    library = shelve.open(library_path, flag='r')
+    try:
+        for key in keys:
+            if _RECORD + key in library:
+                yield library[_RECORD + key]
+    finally:
+        library.close()
+
+
+def query_books(configuration, restrict, select, logger=None):
+    """Yields the books whose field `restrict` contains `select`,
+    ignoring case.
+    """
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            for book in timing.iterate('storage.load', sqlstore.query_books(
+                    connection, restrict, select)):
+                yield book
+        return
+    select = select.upper()
+    for book in load_books(configuration, logger):
+        if restrict in book and select in unicode(book[restrict]).upper():
+            yield book
+
+
+def fields(configuration, logger=None):
+    """Returns the names of the fields used by books in the library.
+    """
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            return sqlstore.fields(connection)
+    names = set()
+    for book in load_books(configuration, logger):
+        names.update(book.keys())
+    return names
+
+
+@timing.timed('storage.store')
+def store_books(configuration, books, logger=None):
+    """Adds books to the library, replacing any stored under the same
+    key. Only records which have changed are written. Returns the number
+    of records written.
+    """
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            return sum(sqlstore.store_book(connection, book_key(book), book)
+                       for book in books)
+    library = _open(configuration, logger)
+    try:
+        return _store_books(library, books)
+    finally:
+        library.close()
+
+
+@timing.timed('storage.store')
+def remove_books(configuration, keys, logger=None):
+    """Removes the books stored under the given keys from the library.
+    Returns the number of records removed.
+    """
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            return sum(sqlstore.remove_book(connection, key) for key in keys)
+    library = _open(configuration, logger)
+    try:
+        return _remove_books(library, keys)
+    finally:
+        library.close()
+
+
+@timing.timed('storage.store')
+def replace_books(configuration, books, logger=None):
+    """Makes the library contain exactly the given books, writing the
+    records that changed and removing the ones that are gone. Returns
+    the number of records written and removed.
+    """
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            keep = {book_key(book) for book in books}
+            gone = sqlstore.keys(connection) - keep
+            return (sum(sqlstore.store_book(connection, book_key(book), book)
+                        for book in books),
+                    sum(sqlstore.remove_book(connection, key)
+                        for key in gone))
+    library = _open(configuration, logger)
+    try:
+        keep = {book_key(book) for book in books}
+        gone = [key for key in library.get(_MANIFEST, ()) if key not in keep]
+        return _store_books(library, books), _remove_books(library, gone)
+    finally:
+        library.close()
+
+
+def content_hashes(configuration, logger=None):
+    """Returns the set of content hashes of the books in the library.
+    The library is not kept open, so the set can be checked while books
+    are being stored.
+    """
+    if _sqlite(configuration):
+        with _connection(configuration, logger) as connection:
+            return sqlstore.hashes(connection)
+    library_path = _library_path(configuration)
+    if not _exists(library_path):
+        return set()
+    if _needs_migration(library_path):
+        migrate(configuration, logger)
+    library = shelve.open(library_path, flag='r')
+    try:
+        return {key[len(_HASH):] for key in library.keys()
+                if key.startswith(_HASH)}
+    finally:
+        library.close()
+
+
+def migrate(configuration, logger=None):
+    """Converts a library which keeps every book in a single 'library'
+    list into one record per book.
+    """
+    library_path = _library_path(configuration)
+    library = shelve.open(library_path)
+    try:
+        count = 0
+        if 'library' in library:
+            books = library['library'] or []
+            if logger is not None:
+                logger.debug('migrating %d books in %s', len(books),
+                             library_path)
+            count = _store_books(library, books)
+            del library['library']
+        library['version'] = VERSION
+        return count
+    finally:
+        library.close()
+
+
+def _store_books(library, books):
+    manifest = library.get(_MANIFEST, set())
+    written = 0
+    for book in books:
+        key = book_key(book)
+        record = _RECORD + key
+        if key in manifest:
+            existing = library[record]
+            if existing == book:
+                continue
+            _unhash(library, key, existing)
+        library[record] = book
+        if book.get('_sha_hash'):
+            library[_HASH + str(book['_sha_hash'])] = key
+        manifest.add(key)
+        written += 1
+    if written > 0:
+        library[_MANIFEST] = manifest
+    return written
+
+
+def _remove_books(library, keys):
+    manifest = library.get(_MANIFEST, set())
+    removed = 0
+    for key in keys:
+        if key in manifest:
+            _unhash(library, key, library[_RECORD + key])
+            del library[_RECORD + key]
+            manifest.discard(key)
+            removed += 1
+    if removed > 0:
+        library[_MANIFEST] = manifest
+    return removed
+
+
+def _unhash(library, key, book):
+    """Removes the hash index entry for a book which is being replaced
+    or removed.
+    """
+    if book.get('_sha_hash'):
+        name = _HASH + str(book['_sha_hash'])
+        if library.get(name) == key:
+            del library[name]
+
+
+def _open(configuration, logger=None):
+    """Opens the library for writing, creating or migrating it if
+    necessary.
+    """
+    library_path = _library_path(configuration)
+    if logger is not None:
+        logger.debug('storing books in %s (exists: %s)', library_path,
+                     _exists(library_path))
+    if _exists(library_path):
+        if _needs_migration(library_path):
+            migrate(configuration, logger)
+        return shelve.open(library_path)
+    library = shelve.open(library_path)
+    library['version'] = VERSION
+    return library
+
+
+@contextmanager
+def _connection(configuration, logger=None):
+    """Opens the SQLite library, committing on success. A new database
+    is filled from the shelve library if there is one.
+    """
+    library_path = _library_path(configuration)
+    created = not sqlstore.exists(library_path)
+    if logger is not None:
+        logger.debug('opening %s (exists: %s)',
+                     sqlstore.database_path(library_path), not created)
+    connection = sqlstore.connect(library_path)
+    try:
+        if created:
+            _import_shelve(connection, library_path, logger)
+        yield connection
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _import_shelve(connection, library_path, logger=None):
+    """Copies a shelve library into a new SQLite database.
+    """
+    sqlstore.store(connection, {'version': VERSION})
+    if not _exists(library_path):
+        return
+    if logger is not None:
+        logger.debug('importing %s', library_path)
+    library = shelve.open(library_path, flag='r')
+    try:
+        books = library.get('library')
+        if books is None:
+            books = (library[_RECORD + key]
+                     for key in library.get(_MANIFEST, ()))
+        for book in books:
+            sqlstore.store_book(connection, book_key(book), book)
+        sqlstore.store(connection, {
+            subject: library[subject] for subject in library.keys()
+            if subject not in ('library', 'version', _MANIFEST)
+            and not subject.startswith((_RECORD, _HASH))
+        })
+    finally:
+        library.close()
+
+
+def _sqlite(configuration):
+    return configuration.get('engine') == 'sqlite'
+
+
+def _needs_migration(library_path):
+    library = shelve.open(library_path, flag='r')
+    try:
+        return 'library' in library or library.get('version', 0) < VERSION
+    finally:
+        library.close()
+
+
+def _exists(library_path):
+    """Returns True if there is a database at the path, whichever dbm
+    implementation created it.
+    """
+    return bool(whichdb(library_path))
+
+
+def library_path(configuration):
+    """Returns the path of the library database.
+    """
+    return _library_path(configuration)
+
+
+def _library_path(configuration):
+    return join(configuration['system']['configpath'],
+                configuration['library'])
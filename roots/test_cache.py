@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Response cache unit tests.
+"""
+
+from os.path import join
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from cache import ResponseCache, StatCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = join(self.directory, 'library.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_responses_are_kept_between_runs(self):
+        cache = ResponseCache(self.path, 1, 1, 10)
+        cache.put('9780297859383', {'data': []})
+        cache.put(u'gone_girl', None)
+        cache.close()
+        cache = ResponseCache(self.path, 1, 1, 10)
+        self.assertEquals((True, {'data': []}), cache.get('9780297859383'))
+        self.assertEquals((True, None), cache.get(u'gone_girl'))
+        self.assertEquals((False, None), cache.get('9780596806'))
+        self.assertEquals((2, 1), (cache.hits, cache.misses))
+        cache.close()
+
+    def test_missing_responses_expire_sooner(self):
+        cache = ResponseCache(self.path, 1, 0, 10)
+        cache.put('9780297859383', {'data': []})
+        cache.put('gone_girl', None)
+        time.sleep(0.01)
+        self.assertEquals((True, {'data': []}), cache.get('9780297859383'))
+        self.assertEquals((False, None), cache.get('gone_girl'))
+        cache.close()
+
+    def test_least_recently_used_responses_are_evicted(self):
+        cache = ResponseCache(self.path, 1, 1, 10)
+        for i in range(10):
+            cache.put(str(i), {'data': [i]})
+        cache.get('0')
+        cache.put('10', {'data': [10]})
+        self.assertEquals((True, {'data': [0]}), cache.get('0'))
+        self.assertEquals((False, None), cache.get('1'))
+        self.assertEquals((True, {'data': [10]}), cache.get('10'))
+        cache.close()
+
+    def test_responses_of_runs_which_did_not_close_are_evicted(self):
+        cache = ResponseCache(self.path, 1, 1, 10)
+        for i in range(10):
+            cache.put(str(i), {'data': [i]})
+        # the process ends without saving the index
+        cache._shelf.close()
+        cache = ResponseCache(self.path, 1, 1, 10)
+        cache.put('10', {'data': [10]})
+        self.assertEquals((False, None), cache.get('0'))
+        self.assertEquals((True, {'data': [9]}), cache.get('9'))
+        cache.close()
+
+
+class StatCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = join(self.directory, 'library.stat')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_entries_are_kept_between_runs(self):
+        with StatCache(self.path) as cache:
+            cache['/books/a.epub'] = ((1.0, 10, 1), {'title': u'A'})
+            cache[u'/books/\xe9.epub'] = ((2.0, 20, 2), {'title': u'E'})
+            cache['/books/gone.epub'] = ((3.0, 30, 3), {})
+            del cache['/books/gone.epub']
+        with StatCache(self.path) as cache:
+            self.assertEquals(((1.0, 10, 1), {'title': u'A'}),
+                              cache.get('/books/a.epub'))
+            self.assertTrue(u'/books/\xe9.epub' in cache)
+            self.assertFalse('/books/gone.epub' in cache)
+            self.assertEquals(2, len(cache))
+            self.assertEquals((None, None),
+                              cache.get('/books/gone.epub', (None, None)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,11 +17,17 @@
 """Test for cli.
 """
 
+from StringIO import StringIO
+import os
+import shutil
+import sys
+import tempfile
 import unittest
 
 from files import _clean_path
 from cli import update
 from click.testing import CliRunner
+import cli
 
 
 # TODO: test without click test framework
@@ -32,5 +38,53 @@ class TestCli(unittest.TestCase):
         #self.assertEqual(0, result.exit_code)
 
 
+class _Terminal(StringIO):
+
+    encoding = 'utf-8'
+
+    def isatty(self):
+        return True
+
+
+class EchoLinesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paged = os.path.join(self.directory, 'paged')
+        self.environ = dict(os.environ)
+        os.environ['PAGER'] = 'cat > %s' % self.paged
+        self.stdout = sys.stdout
+        self.get_terminal_size = cli.get_terminal_size
+        cli.get_terminal_size = lambda: (80, 3)
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        cli.get_terminal_size = self.get_terminal_size
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.directory)
+
+    def _echo(self, lines, terminal=True):
+        sys.stdout = _Terminal() if terminal else StringIO()
+        try:
+            cli._echo_lines(iter(lines))
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = self.stdout
+
+    def test_a_screenful_is_printed(self):
+        self.assertEquals('a\nb\nc\n', self._echo(['a', 'b', 'c']))
+        self.assertFalse(os.path.exists(self.paged))
+
+    def test_more_than_a_screenful_is_paged(self):
+        self.assertEquals('', self._echo(['a', 'b', 'c', u'd\xe9']))
+        with open(self.paged) as f:
+            self.assertEquals('a\nb\nc\nd\xc3\xa9\n', f.read())
+
+    def test_lines_for_other_programs_are_not_paged(self):
+        self.assertEquals('a\nb\nc\nd\n',
+                          self._echo(['a', 'b', 'c', 'd'], terminal=False))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Command unit tests.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import responses
+import yaml
+
+from command import List, RemoteLookup, Update
+from configuration import default_configuration, compile_regex
+import search
+import storage
+from testing import write_epub
+
+
+class RemoteLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = default_configuration()
+        self.configuration['system']['configpath'] = self.configpath
+        self.configuration['isbndb'].update({
+            'key': 'AAAAAAAA',
+            'batch': 1,
+            'cache': None
+        })
+        storage.store_books(self.configuration, [self.gone_girl, self.geek])
+
+    def tearDown(self):
+        shutil.rmtree(self.configpath)
+
+    @responses.activate
+    def test_results_are_merged_into_the_library(self):
+        self._respond('9780297859383', self.gone_girl_response)
+        self._respond('9780596806', self.not_found_response)
+        self._respond('just_a_geek', self.not_found_response)
+        _, err = RemoteLookup({'<query>': ()}, self.configuration).execute()
+        self.assertEquals(None, err)
+        gone_girl, geek = sorted(storage.load_books(self.configuration),
+                                 key=lambda book: book['title'])
+        self.assertEquals(u'Gone Girl', gone_girl['title'])
+        self.assertEquals('SUMMARY', gone_girl['description'])
+        self.assertEquals({'thriller', 'mystery'}, gone_girl['keywords'])
+        self.assertEquals(self.geek, geek)
+
+    @responses.activate
+    def test_local_fields_take_precedence(self):
+        self._respond('9780297859383', self.gone_girl_response)
+        self._respond('9780596806', self.not_found_response)
+        self._respond('just_a_geek', self.not_found_response)
+        RemoteLookup({'<query>': ()}, self.configuration).execute()
+        gone_girl, _ = sorted(storage.load_books(self.configuration),
+                              key=lambda book: book['title'])
+        self.assertEquals(u'Flynn', gone_girl['author'])
+
+    @responses.activate
+    def test_lookups_resume_where_they_stopped(self):
+        self._respond('9780297859383', self.gone_girl_response)
+        self._respond('9780596806', self.not_found_response)
+        self._respond('just_a_geek', self.not_found_response)
+        self.configuration['isbndb']['limit'] = 1
+        _, err = RemoteLookup({'<query>': ()}, self.configuration).execute()
+        self.assertNotEquals(None, err)
+        self.assertEquals(1, len(responses.calls))
+        self.configuration['isbndb']['limit'] = 3
+        storage.store(self.configuration, {'isbndb': {}})
+        _, err = RemoteLookup({'<query>': ()}, self.configuration).execute()
+        self.assertEquals(None, err)
+        self.assertEquals(3, len(responses.calls))
+
+    @responses.activate
+    def test_books_added_before_the_checkpoint_are_looked_up(self):
+        self._respond('9780297859383', self.gone_girl_response)
+        self._respond('9780596806', self.not_found_response)
+        self._respond('just_a_geek', self.not_found_response)
+        self._respond('0000000000', self.not_found_response)
+        self._respond('dark_places', self.not_found_response)
+        self.configuration['isbndb']['limit'] = 1
+        _, err = RemoteLookup({'<query>': ()}, self.configuration).execute()
+        self.assertNotEquals(None, err)
+        storage.store_books(self.configuration, [{
+            'author': u'Gillian Flynn',
+            'title': u'Dark Places',
+            'isbn': u'0000000000'
+        }])
+        self.configuration['isbndb']['limit'] = 10
+        storage.store(self.configuration, {'isbndb': {}})
+        _, err = RemoteLookup({'<query>': ()}, self.configuration).execute()
+        self.assertEquals(None, err)
+        self.assertTrue(any(call.request.url.endswith('/0000000000')
+                            for call in responses.calls))
+
+    @responses.activate
+    def test_books_looked_up_before_a_failure_are_kept(self):
+        self._respond('9780297859383', self.gone_girl_response)
+        self._respond('9780596806', self.not_found_response)
+        self.configuration['isbndb']['batch'] = 2
+        self.configuration['isbndb']['limit'] = 2
+        _, err = RemoteLookup({'<query>': ()}, self.configuration).execute()
+        self.assertNotEquals(None, err)
+        gone_girl, _ = sorted(storage.load_books(self.configuration),
+                              key=lambda book: book['title'])
+        self.assertEquals('SUMMARY', gone_girl['description'])
+        checkpoint = storage.load(self.configuration, 'isbndb_checkpoint')
+        self.assertEquals({'None:None': ('isbn:9780297859383', 1)},
+                          checkpoint)
+
+    def _respond(self, query, body):
+        responses.add(responses.GET,
+                      'http://isbndb.com/api/v2/yaml/AAAAAAAA/book/' + query,
+                      body=body, status=200,
+                      content_type='text/xml; charset=utf-8')
+
+    gone_girl = {
+        'author': u'Flynn',
+        'title': u'Gone Girl',
+        'isbn': u'9780297859383'
+    }
+
+    geek = {
+        'author': u'Wil Wheaton',
+        'title': u'Just a Geek',
+        'isbn': u'9780596806'
+    }
+
+    gone_girl_response = yaml.dump({
+        'data': [{
+            'isbn13': '9780297859383',
+            'summary': 'SUMMARY',
+            'author_data': [{'name': 'Gillian Flynn'}],
+            'subject_ids': ['mystery_thriller'],
+            'title': 'Gone Girl'
+        }]
+    }, default_flow_style=False)
+
+    not_found_response = yaml.dump({
+        'error': 'Unable to locate'
+    }, default_flow_style=False)
+
+
+class UpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = default_configuration()
+        self.configuration['system']['configpath'] = self.configpath
+        self.configuration['directory'] = os.path.join(self.configpath,
+                                                       u'B\xfccher')
+        compile_regex(self.configuration)
+        self.library = self.configuration['directory'].encode('utf-8')
+        self.author = os.path.join(self.library, 'Gillian Flynn')
+        os.makedirs(self.author)
+        self.gone_girl = os.path.join(self.author, 'Gone Girl.epub')
+        write_epub(self.gone_girl, 'Gone Girl', 'Flynn, Gillian')
+
+    def tearDown(self):
+        shutil.rmtree(self.configpath)
+
+    def _update(self):
+        ret, err = Update({'update': True}, self.configuration).execute()
+        self.assertEquals(None, err)
+        return ret.message
+
+    def test_libraries_with_non_ascii_names_are_updated(self):
+        self.assertEquals('Updated 1 book, moved 0.', self._update())
+        self.assertEquals([u'Gone Girl'],
+                          [book['title'] for book in
+                           storage.load_books(self.configuration)])
+
+    def test_libraries_in_the_home_directory_are_updated(self):
+        home = os.environ.get('HOME')
+        os.environ['HOME'] = self.configpath
+        try:
+            self.configuration['directory'] = u'~/B\xfccher'
+            self.assertEquals('Updated 1 book, moved 0.', self._update())
+        finally:
+            if home is None:
+                del os.environ['HOME']
+            else:
+                os.environ['HOME'] = home
+
+    def test_misplaced_books_are_moved_and_their_directory_pruned(self):
+        self.configuration['import']['mode'] = 'move'
+        misplaced = os.path.join(self.library, 'Misplaced')
+        os.makedirs(misplaced)
+        write_epub(os.path.join(misplaced, 'places.epub'),
+                   'Dark Places', 'Flynn, Gillian')
+        self.assertEquals('Updated 2 books, moved 1.', self._update())
+        self.assertTrue(os.path.isfile(os.path.join(self.author,
+                                                    'Dark Places.epub')))
+        self.assertFalse(os.path.exists(misplaced))
+
+    def test_moved_books_are_recached_at_their_new_path(self):
+        self.configuration['import']['mode'] = 'move'
+        misplaced = os.path.join(self.library, 'places.epub')
+        write_epub(misplaced, 'Dark Places', 'Flynn, Gillian')
+        self._update()
+        moved = os.path.join(self.author, 'Dark Places.epub')
+        with Update({}, self.configuration)._load_cache() as cache:
+            self.assertEquals({self.gone_girl, moved}, set(cache))
+
+    def test_books_deleted_from_the_library_are_removed(self):
+        self._update()
+        os.remove(self.gone_girl)
+        self.assertEquals('Updated 0 books, moved 0.', self._update())
+        self.assertEquals([], list(storage.load_books(self.configuration)))
+        self.assertEquals([], search.search(self.configuration, u'girl'))
+
+
+class ListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = default_configuration()
+        self.configuration['system']['configpath'] = self.configpath
+        self.books = [{'author': u'Author %d' % (number % 3),
+                       'title': u'Title %02d' % number,
+                       'isbn': u'%d' % number}
+                      for number in (7, 3, 9, 1, 5, 0, 8, 2, 6, 4)]
+        storage.store_books(self.configuration, self.books)
+
+    def tearDown(self):
+        shutil.rmtree(self.configpath)
+
+    def _list(self, **options):
+        arguments = {'list': True, '<query>': (), '-t': False, '-a': False,
+                     '-i': False}
+        arguments.update(options)
+        ret, err = List(arguments, self.configuration).execute()
+        self.assertEquals(None, err)
+        return ret.message
+
+    def test_pages_are_taken_from_the_sorted_results(self):
+        everything = self._list().split('\n')
+        self.assertEquals(10, len(everything))
+        self.assertEquals(everything[3:6],
+                          self._list(**{'--offset': 3, '--limit': 3})
+                          .split('\n'))
+        self.assertEquals(everything[8:],
+                          self._list(**{'--offset': 8}).split('\n'))
+        self.assertEquals('', self._list(**{'--offset': 10}))
+
+    def test_authors_are_paged(self):
+        self.assertEquals(u'Author 1\nAuthor 2',
+                          self._list(**{'-a': True, '--offset': 1}))
+
+    def test_lines_are_streamed(self):
+        lines = self._list(**{'--stream': True, '--limit': 2})
+        self.assertFalse(isinstance(lines, basestring))
+        self.assertEquals([u'Author 0 - Title 00', u'Author 0 - Title 03'],
+                          list(lines))
+
+    def test_tables_are_paged_from_the_sorted_results(self):
+        rows = self._list(**{'-t': True, '--offset': 1, '--limit': 2})
+        self.assertEquals(['Author 0', 'Author 0'],
+                          [line.split('|')[1].strip()
+                           for line in rows.split('\n')[3:5]])
+        self.assertTrue('Title 03' in rows and 'Title 06' in rows)
+
+    def test_empty_pages_are_empty(self):
+        search.index_books(self.configuration, self.books)
+        self.assertEquals('', self._list(**{'<query>': ('Title',),
+                                            '--limit': 0}))
+        self.assertEquals([], list(self._list(**{'--limit': 0,
+                                                 '--stream': True})))
+
+
+if __name__ == '__main__':
+    unittest.main()
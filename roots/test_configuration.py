@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the configuration.
+"""
+
+from os.path import join, exists, expanduser
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import configuration
+
+
+class UserConfigurationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.home = os.environ.get('HOME')
+        self.cwd = os.getcwd()
+        os.environ['HOME'] = self.directory
+        os.chdir(self.directory)
+        configuration._resolved = None
+        self.write('directory: /books\nimport:\n  jobs: 3\n')
+
+    def tearDown(self):
+        configuration._resolved = None
+        os.chdir(self.cwd)
+        if self.home is not None:
+            os.environ['HOME'] = self.home
+        shutil.rmtree(self.directory)
+
+    def write(self, content, mtime=None):
+        path = join(self.directory, '_config.yaml')
+        with open(path, 'w') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def load(self):
+        configuration._resolved = None
+        return configuration.user_configuration()
+
+    def test_configuration_is_merged_with_the_defaults(self):
+        c = self.load()
+        self.assertEquals('/books', c['directory'])
+        self.assertEquals(3, c['import']['jobs'])
+        self.assertEquals(4, c['import']['transfers'])
+        self.assertEquals(join(self.directory, '_config.yaml'),
+                          c['system']['configfile'])
+
+    def test_configuration_is_built_once(self):
+        self.assertIs(configuration.user_configuration(),
+                      configuration.user_configuration())
+
+    def test_file_configuration_leaves_out_later_changes(self):
+        self.load()['log']['level'] = 'ERROR'
+        self.assertEquals('DEBUG',
+                          configuration.file_configuration()['log']['level'])
+        self.assertEquals(3,
+                          configuration.file_configuration()['import']['jobs'])
+
+    def test_snapshot_is_used_without_parsing(self):
+        expected = self.load()
+        self.assertTrue(exists(expanduser(configuration._SNAPSHOT)))
+        yaml = sys.modules.pop('yaml', None)
+        sys.modules['yaml'] = None
+        try:
+            self.assertEquals(expected, self.load())
+        finally:
+            del sys.modules['yaml']
+            if yaml is not None:
+                sys.modules['yaml'] = yaml
+
+    def test_snapshot_is_invalidated_by_changes(self):
+        mtime = time.time() - 60
+        self.write('directory: /books\n', mtime)
+        self.load()
+        self.write('directory: /other\n', mtime)
+        self.assertEquals('/other', self.load()['directory'])
+        self.write('directory: /other\n')
+        self.assertEquals('/other', self.load()['directory'])
+
+    def test_unreadable_snapshot_is_ignored(self):
+        self.load()
+        with open(expanduser(configuration._SNAPSHOT), 'wb') as f:
+            f.write('not a snapshot')
+        self.assertEquals('/books', self.load()['directory'])
+
+
+if __name__ == '__main__':
+    unittest.main()
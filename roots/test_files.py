@@ -17,10 +17,16 @@
 """Files unit tests.
 """
 
+from collections import Counter
+import os
+import shutil
+import tempfile
 import unittest
 
 from configuration import default_configuration, compile_regex
-from files import _clean_path
+from files import _clean_path, _load_books, find_moves, prune
+import format
+from testing import write_epub
 
 
 class FilesTest(unittest.TestCase):
@@ -42,5 +48,130 @@ class FilesTest(unittest.TestCase):
         ]
 
 
+class PruneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.configuration = {'directory': self.directory}
+        for path in ('a/b/c', 'a/d', 'e', 'f/g'):
+            os.makedirs(os.path.join(self.directory, path))
+        open(os.path.join(self.directory, 'f', 'g', 'book.epub'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _remaining(self):
+        return sorted(os.path.relpath(basepath, self.directory)
+                      for basepath, _, _ in os.walk(self.directory))
+
+    def test_only_the_given_directories_and_ancestors_are_pruned(self):
+        prune(self.configuration, [os.path.join(self.directory, 'a/b/c'),
+                                   os.path.join(self.directory, 'f/g')])
+        self.assertEquals(['.', 'a', 'a/d', 'e', 'f', 'f/g'],
+                          self._remaining())
+        prune(self.configuration, [os.path.join(self.directory, 'a/d')])
+        self.assertEquals(['.', 'e', 'f', 'f/g'], self._remaining())
+
+    def test_every_empty_directory_is_pruned_in_a_full_sweep(self):
+        prune(self.configuration)
+        self.assertEquals(['.', 'f', 'f/g'], self._remaining())
+
+
+class StatCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.configuration = default_configuration()
+        self.configuration['directory'] = self.directory
+        compile_regex(self.configuration)
+        self.path = os.path.join(self.directory, 'Gillian Flynn',
+                                 'Gone Girl.epub')
+        os.makedirs(os.path.dirname(self.path))
+        write_epub(self.path, 'Gone Girl', 'Flynn, Gillian')
+        self.load = format.EpubFormat.load
+
+    def tearDown(self):
+        format.EpubFormat.load = self.load
+        shutil.rmtree(self.directory)
+
+    def test_unchanged_files_are_not_read(self):
+        cache = {}
+        _, books = find_moves(self.configuration, self.directory, cache)
+        self.assertEquals([self.path], cache.keys())
+        loaded = self._count_loads()
+        self.assertEquals(books, find_moves(self.configuration,
+                                            self.directory, cache)[1])
+        self.assertEquals([], loaded)
+
+    def test_changed_files_are_read(self):
+        cache = {}
+        find_moves(self.configuration, self.directory, cache)
+        os.utime(self.path, (0, 0))
+        loaded = self._count_loads()
+        find_moves(self.configuration, self.directory, cache)
+        self.assertEquals([self.path], loaded)
+
+    def test_deleted_files_are_removed(self):
+        cache = {}
+        find_moves(self.configuration, self.directory, cache)
+        os.remove(self.path)
+        self.assertEquals(([], []), find_moves(self.configuration,
+                                               self.directory, cache))
+        self.assertEquals({}, cache)
+
+    def test_files_removed_after_the_walk_are_skipped(self):
+        cache = {}
+        find_moves(self.configuration, self.directory, cache)
+        missing = os.path.join(self.directory, 'Missing.epub')
+        self.assertEquals([self.path], [path for path, _ in _load_books(
+            self.configuration, [missing, self.path], cache, 1, Counter())])
+        self.assertEquals([self.path], cache.keys())
+
+    def test_files_are_counted(self):
+        cache = {}
+        counts = Counter()
+        find_moves(self.configuration, self.directory, cache, counts=counts)
+        find_moves(self.configuration, self.directory, cache, counts=counts)
+        self.assertEquals(2, counts['files_scanned'])
+        self.assertEquals(1, counts['files_parsed'])
+        self.assertEquals(1, counts['files_cached'])
+        self.assertEquals(0, counts['files_failed'])
+
+    def test_books_are_read_in_order_by_several_processes(self):
+        for title in ['Dark Places', 'Sharp Objects', 'The Grownup']:
+            write_epub(os.path.join(self.directory, 'Gillian Flynn',
+                                    title + '.epub'),
+                       title, 'Flynn, Gillian')
+        self.assertEquals(find_moves(self.configuration, self.directory),
+                          find_moves(self.configuration, self.directory,
+                                     jobs=3))
+
+    def test_copies_of_books_are_not_imported(self):
+        self.configuration['import']['hash'] = True
+        source = tempfile.mkdtemp()
+        try:
+            write_epub(os.path.join(source, 'places.epub'),
+                       'Dark Places', 'Flynn, Gillian')
+            shutil.copy(os.path.join(source, 'places.epub'),
+                        os.path.join(source, 'copy.epub'))
+            moves, books = find_moves(self.configuration, source, hashes={})
+            self.assertEquals(1, len(moves))
+            hashes = {books[0]['_sha_hash']: 'isbn:'}
+            self.assertEquals(([], []), find_moves(self.configuration,
+                                                   source, hashes=hashes))
+        finally:
+            shutil.rmtree(source)
+
+    def _count_loads(self):
+        """Records the paths of books which are read."""
+        loaded = []
+        load = self.load
+        def counting_load(cls, srcpath):
+            loaded.append(srcpath)
+            return load(cls, srcpath)
+        format.EpubFormat.load = counting_load
+        return loaded
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -19,7 +19,8 @@
 
 import unittest
 
-from format import BaseFormat
+from StringIO import StringIO
+from format import BaseFormat, EpubFormat
 import xml.etree.ElementTree as etree
 
 
@@ -99,6 +100,27 @@ class FormatTest(unittest.TestCase):
         self.assertEquals("content.opf",
                           cls._search(element, 'rootfile').attrib['full-path'])
 
+    def test_metadata_is_read_without_parsing_the_manifest(self):
+        cls = EpubFormat(None)
+        # the manifest is malformed, so parsing would fail if it were read
+        opf = StringIO('<?xml version="1.0" encoding="utf-8"?>'
+                       '<package xmlns="http://www.idpf.org/2007/opf">'
+                       '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/" '
+                       'xmlns:opf="http://www.idpf.org/2007/opf">'
+                       '<dc:title>Revolution</dc:title>'
+                       '<dc:creator>Brand, Russell</dc:creator>'
+                       '<dc:identifier opf:scheme="MOBI-ASIN">B00LKJHTJU'
+                       '</dc:identifier>'
+                       '<dc:identifier opf:scheme="ISBN">9781101882924'
+                       '</dc:identifier>'
+                       '</metadata>'
+                       '<manifest><item></manifest>')
+        self.assertEquals({
+            'title': u'Revolution',
+            'author': u'Russell Brand',
+            'isbn': u'9781101882924'
+        }, cls._load_ops_data(cls._read_metadata(opf)))
+
     def _opf_helper(self, element):
         return ('<?xml version="1.0" encoding="utf-8"?>'
                 '<metadata '
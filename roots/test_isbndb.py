@@ -17,18 +17,41 @@
 """ISBDDB unit tests.
 """
 
+import atexit
 import yaml
 
 from isbndb import Service
+from datetime import date, timedelta
+import isbndb
+import storage
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from threading import Thread
 
 import responses
+import shutil
 import tempfile
 import unittest
 
 
-@unittest.skip("needs updating, rate throttling coupled to storage")
 class TestIsbndb(unittest.TestCase):
 
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = {
+            'isbndb': {
+                'key': 'AAAAAAAA',
+                'limit': None
+            },
+            'system': {
+                'configpath': self.configpath
+            },
+            'library': 'library.db',
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.configpath)
+
     @responses.activate
     def test_response_includes_all_fields(self):
         input = [{
@@ -234,6 +257,102 @@ class TestIsbndb(unittest.TestCase):
         self.assertEquals(1, len(responses.calls))
 
 
+    def test_requests_are_reserved_in_blocks(self):
+        self.configuration['isbndb'].update({'limit': 100, 'reserve': 50})
+        throttle = Service.Throttle(self.configuration)
+        throttle.check()
+        throttle.check()
+        rate = storage.load(self.configuration, 'isbndb')['rate']
+        self.assertEquals(50, rate.limit)
+        throttle.release()
+        rate = storage.load(self.configuration, 'isbndb')['rate']
+        self.assertEquals(98, rate.limit)
+
+    def test_requests_reserved_yesterday_are_not_returned_today(self):
+        self.configuration['isbndb'].update({'limit': 100, 'reserve': 50})
+        throttle = Service.Throttle(self.configuration)
+        throttle.check()
+
+        class Tomorrow(date):
+            @classmethod
+            def today(cls):
+                return date.today() + timedelta(days=1)
+        isbndb.date, today = Tomorrow, isbndb.date
+        try:
+            throttle.release()
+            self.assertEquals(100, throttle.remaining())
+            throttle.check()
+            self.assertEquals(99, throttle.remaining())
+        finally:
+            isbndb.date = today
+
+    def test_exit_releases_throttles_once_registered(self):
+        self.configuration['isbndb'].update({'limit': 100, 'reserve': 10})
+        isbndb._throttles.clear()
+        registered = []
+        register = atexit.register
+        atexit.register = registered.append
+        try:
+            throttles = [Service.Throttle(self.configuration)
+                         for _ in range(3)]
+        finally:
+            atexit.register = register
+        self.assertEquals([isbndb._release_throttles], registered)
+        for throttle in throttles:
+            throttle.check()
+        isbndb._release_throttles()
+        rate = storage.load(self.configuration, 'isbndb')['rate']
+        self.assertEquals(97, rate.limit)
+
+    def test_reservations_are_shared_between_throttles(self):
+        self.configuration['isbndb'].update({'limit': 3, 'reserve': 2})
+        first = Service.Throttle(self.configuration)
+        second = Service.Throttle(self.configuration)
+        first.check()
+        second.check()
+        self.assertRaises(Exception, second.check)
+        first.check()
+        self.assertRaises(Exception, first.check)
+
+    @responses.activate
+    def test_responses_are_cached(self):
+        input = [{
+            'author': 'Gillian Flynn',
+            'title': 'Gone Girl',
+            'isbn': '0999999X'
+        }]
+
+        responses.add(responses.GET,
+                      'http://isbndb.com/api/v2/yaml/AAAAAAAA/book/0999999X',
+                      body=yaml.dump({
+                          'error': 'Unable to locate 0999999X'
+                      }, default_flow_style=False),
+                      content_type='text/xml; charset=utf-8')
+        responses.add(responses.GET,
+                      'http://isbndb.com/api/v2/yaml/AAAAAAAA/book/gone_girl',
+                      body=self.gone_girl_response, status=200,
+                      content_type='text/xml; charset=utf-8')
+
+        self.configuration['isbndb']['cache'] = {
+            'ttl': 30,
+            'negative_ttl': 1,
+            'size': 100
+        }
+        with Service(self.configuration) as service:
+            first = service.request(input)
+        with Service(self.configuration) as service:
+            second = service.request(input)
+            # the cache stays open for the rest of the run
+            self.assertNotEquals(None, service._cache._shelf)
+        self.assertEquals(None, service._cache._shelf)
+        self.assertEquals(2, len(responses.calls))
+        self.assertEquals(first, second)
+        self.assertEquals({
+            'isbndb_requests': 0,
+            'isbndb_cache_hits': 2,
+            'isbndb_cache_misses': 0
+        }, service.counts())
+
     gone_girl_response = yaml.dump({
         'data': [{
             'isbn13': '9780297859383',
@@ -272,16 +391,83 @@ class TestIsbndb(unittest.TestCase):
         'index_searched': 'isbn'
     }, default_flow_style=False)
 
-    configuration = {
-        'isbndb': {
-            'key': 'AAAAAAAA',
-            'limit': None
-        },
-        'system': {
-            'configpath': tempfile.mkdtemp()
-        },
-        'library': 'library.db',
-    }
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    """Answers every book request with the data for the ISBN asked for."""
+    daemon_threads = True
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        isbn = self.path.rsplit('/', 1)[-1]
+        self.server.paths.append(self.path)
+        body = yaml.dump({'data': [{
+            'isbn13': isbn,
+            'summary': '',
+            'author_data': [{'name': 'Author %s' % isbn}],
+            'subject_ids': [],
+            'title': 'Title %s' % isbn
+        }]}, default_flow_style=False)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConcurrentLookup(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _StubServer(('127.0.0.1', 0), _StubHandler)
+        self.server.paths = []
+        Thread(target=self.server.serve_forever).start()
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = {
+            'isbndb': {
+                'key': 'AAAAAAAA',
+                'limit': None,
+                'url': 'http://127.0.0.1:%d/' % self.server.server_port,
+                'workers': 4
+            },
+            'system': {
+                'configpath': self.configpath
+            },
+            'library': 'library.db',
+        }
+        self.books = [{'author': 'Author', 'title': 'Title', 'isbn': str(i)}
+                      for i in range(10)]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.configpath)
+
+    def test_results_are_in_order(self):
+        response = Service(self.configuration).request(self.books)
+        self.assertEquals(10, len(self.server.paths))
+        self.assertEquals([str(i) for i in range(10)],
+                          [book['isbn'] for book in response])
+        self.assertEquals('Title 3', response[3]['title'])
+
+    def test_the_throttle_rate_is_not_exceeded(self):
+        self.configuration['isbndb']['limit'] = 7
+        cls = Service(self.configuration)
+        self.assertRaises(Exception, cls.request, self.books)
+        self.assertEquals(7, len(self.server.paths))
+
+    def test_reserved_requests_are_kept_until_the_run_is_over(self):
+        self.configuration['isbndb'].update({'limit': 100, 'reserve': 50})
+        with Service(self.configuration) as service:
+            service.request(self.books[:5])
+            service.request(self.books[5:])
+            rate = storage.load(self.configuration, 'isbndb')['rate']
+            self.assertEquals(50, rate.limit)
+        rate = storage.load(self.configuration, 'isbndb')['rate']
+        self.assertEquals(90, rate.limit)
 
 
 if __name__ == '__main__':
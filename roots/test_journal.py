@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import journal unit tests.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import journal
+import storage
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = {
+            'library': 'library.db',
+            'system': {'configpath': self.configpath}
+        }
+        self.moves = []
+        for name in ('complete', 'partial', 'missing'):
+            srcpath = os.path.join(self.configpath, name + '.epub')
+            with open(srcpath, 'wb') as f:
+                f.write('x' * 100)
+            self.moves.append((srcpath, srcpath + '.dst'))
+        self.books = [
+            {'title': u'Gone Girl', 'author': u'Gillian Flynn',
+             'isbn': u'9780297859383'},
+            {'title': u'Just a Geek', 'author': u'Wil Wheaton',
+             'isbn': u'9780596806'},
+            {'title': u'Thérèse Raquin', 'author': u'Émile Zola',
+             'isbn': u''}
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.configpath)
+
+    def _die(self, log):
+        """Ends an import as if its process died, leaving its journal.
+        """
+        log._file.close()
+        log._file = None
+
+    def test_committed_batches_leave_no_journal(self):
+        with journal.Journal(self.configuration) as log:
+            first = log.begin(self.moves[:1], self.books[:1])
+            second = log.begin(self.moves[1:], self.books[1:])
+            log.commit(first)
+            log.commit(second)
+        self.assertFalse(os.path.exists(
+            journal.journal_path(self.configuration)))
+        self.assertEqual((0, 0), journal.recover(self.configuration))
+
+    def test_interrupted_batches_are_recovered(self):
+        log = journal.Journal(self.configuration)
+        log.begin(self.moves, self.books)
+        shutil.copy(*self.moves[0])
+        with open(self.moves[1][1], 'wb') as f:
+            f.write('x' * 10)
+        self._die(log)
+        self.assertEqual((1, 1), journal.recover(self.configuration))
+        self.assertEqual([u'Gone Girl'], [book['title'] for book in
+                                          storage.load_books(self.configuration)])
+        self.assertTrue(os.path.exists(self.moves[0][1]))
+        self.assertFalse(os.path.exists(self.moves[1][1]))
+        self.assertFalse(os.path.exists(
+            journal.journal_path(self.configuration)))
+
+    def test_committed_batches_are_not_recovered(self):
+        log = journal.Journal(self.configuration)
+        first = log.begin(self.moves[:1], self.books[:1])
+        log.begin(self.moves[1:], self.books[1:])
+        shutil.copy(*self.moves[0])
+        shutil.copy(*self.moves[1])
+        log.commit(first)
+        self._die(log)
+        self.assertEqual((1, 0), journal.recover(self.configuration))
+        self.assertEqual([u'Just a Geek'], [book['title'] for book in
+                                            storage.load_books(self.configuration)])
+
+    def test_imports_still_running_are_left_alone(self):
+        log = journal.Journal(self.configuration)
+        batch = log.begin(self.moves, self.books)
+        shutil.copy(*self.moves[0])
+        with open(self.moves[1][1], 'wb') as f:
+            f.write('x' * 10)
+        self.assertEqual((0, 0), journal.recover(self.configuration))
+        self.assertTrue(os.path.exists(self.moves[1][1]))
+        self.assertTrue(os.path.exists(
+            journal.journal_path(self.configuration)))
+        log.commit(batch)
+        log.close()
+        self.assertFalse(os.path.exists(
+            journal.journal_path(self.configuration)))
+
+    def test_journals_which_have_gone_are_closed(self):
+        log = journal.Journal(self.configuration)
+        os.remove(journal.journal_path(self.configuration))
+        log.close()
+
+    def test_books_being_overwritten_are_not_removed(self):
+        srcpath, dstpath = self.moves[0]
+        with open(dstpath, 'wb') as f:
+            f.write('old')
+        log = journal.Journal(self.configuration)
+        log.begin(self.moves[:1], self.books[:1])
+        self._die(log)
+        self.assertEqual((0, 0), journal.recover(self.configuration))
+        with open(dstpath, 'rb') as f:
+            self.assertEqual('old', f.read())
+
+    def test_overwritten_books_are_recovered(self):
+        srcpath, dstpath = self.moves[0]
+        with open(dstpath, 'wb') as f:
+            f.write('old')
+        log = journal.Journal(self.configuration)
+        log.begin(self.moves[:1], self.books[:1])
+        os.remove(dstpath)
+        shutil.copy(srcpath, dstpath)
+        self._die(log)
+        self.assertEqual((1, 0), journal.recover(self.configuration))
+
+    def test_sources_which_have_gone_are_left_out(self):
+        os.remove(self.moves[0][0])
+        log = journal.Journal(self.configuration)
+        log.begin(self.moves, self.books)
+        shutil.copy(*self.moves[1])
+        self._die(log)
+        self.assertEqual((1, 0), journal.recover(self.configuration))
+        self.assertEqual([u'Just a Geek'], [book['title'] for book in
+                                            storage.load_books(self.configuration)])
+
+    def test_paths_need_not_be_utf8(self):
+        srcpath = os.path.join(self.configpath, 'caf\xe9.epub')
+        with open(srcpath, 'wb') as f:
+            f.write('x' * 100)
+        log = journal.Journal(self.configuration)
+        log.begin([(srcpath, srcpath + '.dst')], self.books[:1])
+        with open(srcpath + '.dst', 'wb') as f:
+            f.write('x')
+        self._die(log)
+        self.assertEqual((0, 1), journal.recover(self.configuration))
+        self.assertFalse(os.path.exists(srcpath + '.dst'))
+
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for run metrics.
+"""
+
+from os.path import join
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import metrics
+import timing
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.configuration = {
+            'directory': self.directory,
+            'library': 'library.db',
+            'system': {'configpath': self.directory},
+            'metrics': {
+                'json': join(self.directory, 'metrics.json'),
+                'textfile': self.directory
+            }
+        }
+        self.library = join(self.directory, 'library.db')
+
+    def tearDown(self):
+        timing._enabled = False
+        timing.reset()
+        shutil.rmtree(self.directory)
+
+    def test_runs_are_appended_as_json(self):
+        for count in (1, 2):
+            with metrics.record('update', self.configuration) as run:
+                run.counts['files_scanned'] += count
+                with timing.span('walk'):
+                    pass
+                run.success = True
+        with open(self.configuration['metrics']['json']) as f:
+            runs = [json.loads(line) for line in f]
+        self.assertEquals([1, 2],
+                          [entry['counts']['files_scanned'] for entry in runs])
+        self.assertEquals(1, runs[1]['stages']['walk']['calls'])
+        self.assertTrue(runs[1]['success'])
+
+    def test_textfile_is_replaced_by_each_run(self):
+        for count in (1, 2):
+            with metrics.record('import', self.configuration) as run:
+                run.counts['files_transferred'] = count
+        textfiles = [name for name in os.listdir(self.directory)
+                     if name.endswith('.prom')]
+        self.assertEquals(1, len(textfiles))
+        with open(join(self.directory, textfiles[0])) as f:
+            lines = f.read().splitlines()
+        self.assertIn('# TYPE roots_files_transferred gauge', lines)
+        self.assertIn('roots_files_transferred{command="import",library="%s"}'
+                      ' 2.0' % self.library, lines)
+        self.assertIn('roots_run_success{command="import",library="%s"} 0.0'
+                      % self.library, lines)
+
+    def test_failed_runs_are_recorded(self):
+        with self.assertRaises(ValueError):
+            with metrics.record('lookup', self.configuration) as run:
+                run.counts['isbndb_requests'] += 1
+                raise ValueError()
+        with open(self.configuration['metrics']['json']) as f:
+            recorded = json.loads(f.read())
+        self.assertFalse(recorded['success'])
+        self.assertEquals(1, recorded['counts']['isbndb_requests'])
+
+    def test_metrics_which_cannot_be_written_do_not_end_the_run(self):
+        self.configuration['metrics']['textfile'] = join(self.directory,
+                                                         'missing')
+        self.configuration['system']['configpath'] = join(self.directory,
+                                                          'caf\xe9')
+        with self.assertRaises(KeyError):
+            with metrics.record('update', self.configuration):
+                raise KeyError()
+        with open(self.configuration['metrics']['json']) as f:
+            recorded = json.loads(f.read())
+        self.assertTrue(recorded['library'].endswith(u'caf\ufffd/library.db'))
+
+    def test_nothing_is_written_unless_configured(self):
+        self.configuration['metrics'] = {'json': None, 'textfile': None}
+        with metrics.record('update', self.configuration) as run:
+            run.success = True
+        self.assertEquals([], os.listdir(self.directory))
+        self.assertFalse(timing.enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Path sanitiser unit tests.
+"""
+
+import unittest
+
+from configuration import default_configuration, compile_regex
+import paths
+
+
+class SanitiserTest(unittest.TestCase):
+
+    names = [
+        u'Space: The Final Frontier',
+        u'Spaces, The Final Frontier   ',
+        u'.invisible',
+        u'visible.',
+        u'windows<>*nix?',
+        u'AC/DC \\ Live',
+        u'bell\x07 and tab\t',
+        u'Thérèse Raquin',
+        u'Émile Zola'
+    ]
+
+    def setUp(self):
+        self.configuration = default_configuration()
+        compile_regex(self.configuration)
+
+    def test_names_are_cleaned_as_by_each_replacement_in_turn(self):
+        replacements = self.configuration['import']['replacements']
+        for name in self.names:
+            expected = name
+            for expression, replacement in replacements.iteritems():
+                expected = expression.sub(replacement, expected)
+            self.assertEquals(expected.encode('utf-8'),
+                              paths.clean(self.configuration, name))
+
+    def test_character_sets_are_translated(self):
+        sanitiser = paths.Sanitiser({r'[<>]': '_', r'x+': 'y', r'[^a]': ''})
+        self.assertEquals({ord('<'): u'_', ord('>'): u'_'}, sanitiser._table)
+        self.assertEquals(['[^a]', 'x+'],
+                          sorted(e.pattern for e, _ in sanitiser._patterns))
+
+    def test_names_are_cached(self):
+        sanitiser = paths.Sanitiser({r'[<>]': '_'}, size=2)
+        for name in (u'a<', u'b>', u'a<', u'c'):
+            sanitiser.clean(name)
+        self.assertEquals([u'a<', u'c'], list(sanitiser._cache))
+
+    def test_the_sanitiser_is_compiled_once(self):
+        self.assertTrue(paths.sanitiser(self.configuration)
+                        is paths.sanitiser(self.configuration))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pipeline unit tests.
+"""
+
+import unittest
+
+import pipeline
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_items_pass_through_every_stage_in_order(self):
+        self.assertEquals([(i + 1) * 2 for i in range(100)], list(
+            pipeline.run(xrange(100), [lambda i: i + 1, lambda i: i * 2])))
+
+    def test_errors_in_stages_are_raised(self):
+        def stage(i):
+            if i == 5:
+                raise ValueError(i)
+            return i
+        results = []
+        with self.assertRaises(ValueError):
+            for i in pipeline.run(xrange(100), [stage]):
+                results.append(i)
+        self.assertEquals(range(5), results)
+
+    def test_errors_in_the_source_are_raised(self):
+        def source():
+            yield 1
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            list(pipeline.run(source(), [lambda i: i]))
+
+    def test_stopping_early_stops_the_source(self):
+        closed = []
+        def source():
+            try:
+                for i in xrange(1000):
+                    yield i
+            finally:
+                closed.append(True)
+        for i in pipeline.run(source(), [lambda i: i], size=1):
+            break
+        self.assertEquals([True], closed)
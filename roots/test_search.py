@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Search index unit tests.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import search
+import storage
+
+
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = {
+            'library': 'library.db',
+            'system': {'configpath': self.configpath}
+        }
+        storage.store_books(self.configuration, self.books)
+        search.index_books(self.configuration, self.books)
+
+    def tearDown(self):
+        shutil.rmtree(self.configpath)
+
+    def test_terms_are_case_and_accent_folded(self):
+        self.assertEquals([u'emile', u'zola', u'therese', u'raquin'],
+                          search.tokenise(u'Émile Zola: THÉRÈSE Raquin'))
+
+    def test_there_are_no_results_without_an_index(self):
+        shutil.rmtree(self.configpath)
+        self.configpath = tempfile.mkdtemp()
+        self.configuration['system']['configpath'] = self.configpath
+        self.assertEquals(None, search.search(self.configuration, u'girl'))
+
+    def test_every_term_must_match(self):
+        self.assertEquals(['isbn:9780297859383'], search.search(
+            self.configuration, u'thriller marriage'))
+        self.assertEquals([], search.search(
+            self.configuration, u'thriller wheaton'))
+
+    def test_results_are_ranked(self):
+        # a match in the title counts for more than one in the description
+        self.assertEquals(['isbn:9780596806', 'isbn:9780297859383'],
+                          search.search(self.configuration, u'geek'))
+
+    def test_removed_books_are_not_found(self):
+        search.replace_books(self.configuration, self.books[1:])
+        self.assertEquals([], search.search(self.configuration, u'thriller'))
+        self.assertEquals(['isbn:9780596806'],
+                          search.search(self.configuration, u'geek'))
+
+    books = [{
+        'author': u'Gillian Flynn',
+        'title': u'Gone Girl',
+        'isbn': u'9780297859383',
+        'keywords': {u'thriller', u'mystery'},
+        'description': u'A marriage gone wrong, and a geek or two.'
+    }, {
+        'author': u'Wil Wheaton',
+        'title': u'Just a Geek',
+        'isbn': u'9780596806',
+    }]
+
+
+if __name__ == '__main__':
+    unittest.main()
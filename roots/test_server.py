@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Server unit tests.
+"""
+
+from threading import Thread
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from command import command, Served
+from configuration import default_configuration
+import server
+import storage
+
+
+class ServerTest(unittest.TestCase):
+
+    gone_girl = {'title': u'Gone Girl', 'author': u'Gillian Flynn',
+                 'isbn': u'9780297859383'}
+    geek = {'title': u'Just a Geek', 'author': u'Wil Wheaton',
+            'isbn': u'9780596806', 'description': u'A memoir.'}
+
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = default_configuration()
+        self.configuration['system']['configpath'] = self.configpath
+        storage.store_books(self.configuration, [self.gone_girl, self.geek])
+        self.daemon = None
+
+    def tearDown(self):
+        if self.daemon is not None:
+            self.daemon.shutdown()
+            self.thread.join()
+        shutil.rmtree(self.configpath)
+
+    def _serve(self):
+        self.daemon = server.Server(self.configuration, command)
+        self.thread = Thread(target=self.daemon.serve)
+        self.thread.start()
+
+    def test_the_library_is_queried_like_storage(self):
+        library = server.Library(self.configuration)
+        for restrict, select in (('title', u'geek'), ('author', u'FLYNN'),
+                                 ('description', u'memoir'), ('isbn', u'x')):
+            self.assertEquals(
+                list(storage.query_books(self.configuration, restrict,
+                                         select)),
+                list(library.query_books(self.configuration, restrict,
+                                         select)))
+        self.assertEquals(storage.fields(self.configuration),
+                          library.fields(self.configuration))
+
+    def test_the_library_is_read_again_when_it_changes(self):
+        library = server.Library(self.configuration)
+        self.assertEquals(2, len(list(library.load_books(self.configuration))))
+        time.sleep(0.01)
+        storage.remove_books(self.configuration, ['isbn:9780596806'])
+        self.assertEquals([self.gone_girl],
+                          list(library.load_books(self.configuration)))
+
+    def test_queries_are_answered_by_a_running_server(self):
+        arguments = {'list': True, '<query>': ('author:wheaton',),
+                     '-t': False, '-a': False, '-i': False}
+        self._serve()
+        listing = command(arguments, self.configuration)
+        self.assertTrue(isinstance(listing, Served))
+        ret, err = listing.execute()
+        self.assertEquals(None, err)
+        self.assertEquals(u'Wil Wheaton - Just a Geek', ret.message)
+        ret, err = command({'fields': True}, self.configuration).execute()
+        self.assertEquals({'author', 'title', 'isbn', 'description'},
+                          set(ret.message.split('\n')))
+
+    def test_queries_are_answered_locally_if_the_server_does_not_answer(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(server.socket_path(self.configuration))
+        listener.listen(1)
+        def hang_up():
+            connection, _ = listener.accept()
+            connection.recv(4096)
+            connection.close()
+        thread = Thread(target=hang_up)
+        thread.start()
+        try:
+            ret, err = command({'fields': True}, self.configuration).execute()
+        finally:
+            thread.join()
+            listener.close()
+        self.assertEquals({'author', 'title', 'isbn', 'description'},
+                          set(ret.message.split('\n')))
+
+    def test_queries_are_answered_locally_if_the_server_has_gone(self):
+        open(server.socket_path(self.configuration), 'w').close()
+        ret, err = command({'fields': True}, self.configuration).execute()
+        self.assertEquals({'author', 'title', 'isbn', 'description'},
+                          set(ret.message.split('\n')))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Startup regression tests.
+
+Each command is run in a new interpreter, which reports the modules it
+loaded.
+"""
+
+from os.path import dirname, abspath, join
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# modules which only some commands need
+HEAVY = ('requests', 'texttable', 'zipfile', 'xml', 'HTMLParser',
+         'multiprocessing', 'sqlite3', 'ctypes', 'yaml')
+
+_RUN = '''
+import atexit, json, sys
+def report():
+    sys.stderr.write(json.dumps(sorted(
+        name.split('.')[0] for name, module in sys.modules.items()
+        if module is not None)) + '\\n')
+atexit.register(report)
+sys.argv = ['root'] + sys.argv[1:]
+%s
+'''
+
+_MAIN = 'from roots.roots import main; main()'
+
+
+def run(arguments, directory=None):
+    """Runs the root command with the given arguments, in the
+    directory, and returns the modules it loaded.
+    """
+    environment = dict(os.environ, PYTHONPATH=dirname(dirname(abspath(
+        __file__))))
+    if directory is not None:
+        environment['HOME'] = directory
+    process = subprocess.Popen(
+        [sys.executable, '-c', _RUN % _MAIN] + arguments,
+        cwd=directory, env=environment,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    return set(json.loads(err.strip().splitlines()[-1]))
+
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(join(self.directory, '_config.yaml'), 'w') as f:
+            f.write('directory: %s\nlibrary: library.db\n' % self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_queries_do_not_load_other_commands_modules(self):
+        # the first run parses the configuration and keeps a snapshot
+        run(['fields'], directory=self.directory)
+        for arguments in (['list'], ['list', 'girl'], ['fields'],
+                          ['config', '-p']):
+            modules = run(arguments, directory=self.directory)
+            self.assertEquals([], sorted(modules.intersection(HEAVY)),
+                              ' '.join(arguments))
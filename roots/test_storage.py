@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Storage unit tests.
+"""
+
+import shelve
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import storage
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configpath = tempfile.mkdtemp()
+        self.configuration = {
+            'library': 'library.db',
+            'system': {'configpath': self.configpath}
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.configpath)
+
+    def test_books_are_stored_and_loaded(self):
+        storage.store_books(self.configuration, [self.gone_girl, self.geek])
+        self.assertEquals(sorted([self.gone_girl, self.geek]),
+                          sorted(storage.load_books(self.configuration)))
+
+    def test_only_changed_books_are_written(self):
+        storage.store_books(self.configuration, [self.gone_girl, self.geek])
+        changed = dict(self.geek, title=u'Just a Geek (Revised)')
+        self.assertEquals(1, storage.store_books(
+            self.configuration, [self.gone_girl, changed]))
+        self.assertEquals(0, storage.store_books(
+            self.configuration, [self.gone_girl, changed]))
+
+    def test_replacing_books_removes_missing_records(self):
+        storage.store_books(self.configuration, [self.gone_girl, self.geek])
+        self.assertEquals((0, 1), storage.replace_books(
+            self.configuration, [self.gone_girl]))
+        self.assertEquals([self.gone_girl],
+                          list(storage.load_books(self.configuration)))
+
+    def test_books_without_isbn_are_keyed_by_hash_or_name(self):
+        book = {'author': u'Foo', 'title': u'Bar', 'isbn': ''}
+        self.assertEquals('name:foo/bar', storage.book_key(book))
+        book['_sha_hash'] = 'abc'
+        self.assertEquals('sha1:abc', storage.book_key(book))
+        book['_key'] = u'name:bront\xeb/\xe9t\xe9'
+        self.assertEquals('name:bront\xc3\xab/\xc3\xa9t\xc3\xa9',
+                          storage.book_key(book))
+
+    def test_single_list_library_is_migrated(self):
+        library = shelve.open(join(self.configpath, 'library.db'))
+        library['version'] = 1
+        library['library'] = [self.gone_girl, self.geek]
+        library.close()
+        self.assertEquals(sorted([self.gone_girl, self.geek]),
+                          sorted(storage.load(self.configuration, 'library')))
+        library = shelve.open(join(self.configpath, 'library.db'), flag='r')
+        self.assertFalse('library' in library)
+        self.assertEquals(storage.VERSION, library['version'])
+        library.close()
+
+    def test_content_hashes_are_indexed(self):
+        book = dict(self.gone_girl, _sha_hash='abc')
+        storage.store_books(self.configuration, [book])
+        self.assertEquals({'abc'}, storage.content_hashes(self.configuration))
+        storage.remove_books(self.configuration, ['isbn:9780297859383'])
+        self.assertEquals(set(), storage.content_hashes(self.configuration))
+
+    def test_books_keyed_by_non_ascii_names_are_stored(self):
+        book = {'author': u'Bront\xeb, Emily', 'title': u'\xc9t\xe9',
+                'isbn': ''}
+        key = storage.book_key(book)
+        storage.store_books(self.configuration, [book])
+        self.assertEquals([book], list(storage.get_books(self.configuration,
+                                                         [key])))
+        self.assertEquals((1, 1), storage.replace_books(self.configuration,
+                                                        [self.geek]))
+        self.assertEquals([self.geek],
+                          list(storage.load_books(self.configuration)))
+
+    def test_books_are_queried_by_field(self):
+        storage.store_books(self.configuration, [self.gone_girl, self.geek])
+        self.assertEquals([self.geek], list(storage.query_books(
+            self.configuration, 'author', u'WHEAT')))
+        self.assertEquals([], list(storage.query_books(
+            self.configuration, 'description', u'geek')))
+
+    gone_girl = {
+        'author': u'Gillian Flynn',
+        'title': u'Gone Girl',
+        'isbn': u'9780297859383'
+    }
+
+    geek = {
+        'author': u'Wil Wheaton',
+        'title': u'Just a Geek',
+        'isbn': u'9780596806'
+    }
+
+
+class SqliteStorageTest(StorageTest):
+
+    def setUp(self):
+        super(SqliteStorageTest, self).setUp()
+        self.configuration['engine'] = 'sqlite'
+
+    def test_single_list_library_is_migrated(self):
+        library = shelve.open(join(self.configpath, 'library.db'))
+        library['version'] = 1
+        library['library'] = [self.gone_girl, self.geek]
+        library.close()
+        self.assertEquals(sorted([self.gone_girl, self.geek]),
+                          sorted(storage.load(self.configuration, 'library')))
+
+    def test_extra_fields_are_queried(self):
+        book = dict(self.gone_girl, keywords={u'thriller', u'mystery'},
+                    description=u'A marriage gone wrong.')
+        storage.store_books(self.configuration, [book, self.geek])
+        self.assertEquals([book], list(storage.query_books(
+            self.configuration, 'description', u'MARRIAGE')))
+        self.assertEquals([book], list(storage.query_books(
+            self.configuration, 'keywords', u'thrill')))
+        self.assertEquals({'author', 'title', 'isbn', 'keywords',
+                           'description'}, storage.fields(self.configuration))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for timing spans and logging.
+"""
+
+import unittest
+
+import logger
+import timing
+
+
+class TimingTest(unittest.TestCase):
+
+    def setUp(self):
+        timing.reset()
+        timing.enable()
+
+    def tearDown(self):
+        timing._enabled = False
+        timing.reset()
+
+    def test_spans_are_added_up_by_name(self):
+        for _ in range(3):
+            with timing.span('parse'):
+                pass
+        with timing.span('hash'):
+            pass
+        totals = timing.totals()
+        self.assertEquals(3, totals['parse'][0])
+        self.assertEquals(1, totals['hash'][0])
+        self.assertTrue(timing.report().startswith('stage'))
+
+    def test_timed_functions_are_timed(self):
+        @timing.timed('store')
+        def store(value):
+            return value * 2
+        self.assertEquals(4, store(2))
+        self.assertEquals(1, timing.totals()['store'][0])
+
+    def test_each_step_of_an_iteration_is_timed(self):
+        self.assertEquals([1, 2, 3],
+                          list(timing.iterate('walk', iter([1, 2, 3]))))
+        self.assertEquals(3, timing.totals()['walk'][0])
+
+    def test_nothing_is_timed_until_enabled(self):
+        timing._enabled = False
+        items = [1, 2]
+        self.assertIs(items, timing.iterate('walk', items))
+        with timing.span('parse'):
+            pass
+        self.assertEquals({}, timing.totals())
+
+
+class LoggerTest(unittest.TestCase):
+
+    def test_handler_is_added_once(self):
+        log = logger.get_logger('LoggerTest', None)
+        log = logger.get_logger('LoggerTest', None)
+        self.assertEquals(1, len(log.handlers))
+
+    def test_level_is_configured(self):
+        log = logger.get_logger('LoggerTest', {'log': {'level': 'WARNING'}})
+        self.assertFalse(log.isEnabledFor(logger.logging.INFO))
+        self.assertTrue(log.isEnabledFor(logger.logging.ERROR))
+
+
+if __name__ == '__main__':
+    unittest.main()
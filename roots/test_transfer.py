@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Transfer unit tests.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from configuration import default_configuration
+import files
+import transfer
+
+
+class TransferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'inbox')
+        self.library = os.path.join(self.directory, 'library')
+        os.makedirs(self.source)
+        self.moves = []
+        for i in range(8):
+            srcpath = os.path.join(self.source, '%d.epub' % i)
+            with open(srcpath, 'wb') as f:
+                f.write(os.urandom(4096 * (i + 1)))
+            destpath = os.path.join(self.library, 'Author %d' % (i % 2),
+                                    '%d.epub' % i)
+            self.moves.append((srcpath, destpath))
+        self.functions = transfer._copy_file_range, transfer._sendfile
+
+    def tearDown(self):
+        transfer._copy_file_range, transfer._sendfile = self.functions
+        shutil.rmtree(self.directory)
+
+    def assertCopied(self):
+        for srcpath, destpath in self.moves:
+            with open(srcpath, 'rb') as src, open(destpath, 'rb') as dest:
+                self.assertEqual(src.read(), dest.read())
+            self.assertEqual(int(os.stat(srcpath).st_mtime),
+                             int(os.stat(destpath).st_mtime))
+
+    def test_files_are_copied_concurrently(self):
+        engine = transfer.Transfer(transfer.copy, workers=4)
+        self.assertEqual(8, engine.run(self.moves))
+        self.assertCopied()
+        self.assertEqual(8, engine.files)
+        self.assertEqual(4096 * 36, engine.bytes)
+
+    def test_files_are_copied_without_kernel_support(self):
+        transfer._copy_file_range, transfer._sendfile = None, None
+        self.assertEqual(8, transfer.Transfer(transfer.copy).run(self.moves))
+        self.assertCopied()
+
+    def test_failed_transfers_are_not_counted(self):
+        os.remove(self.moves[0][0])
+        engine = transfer.Transfer(transfer.copy, workers=2)
+        self.assertEqual(7, engine.run(self.moves))
+        self.assertFalse(os.path.exists(self.moves[0][1]))
+
+    def test_failed_copies_leave_nothing_behind(self):
+        transfer._copy_file_range, transfer._sendfile = None, None
+        def copyfileobj(src, dest, length):
+            dest.write('partial')
+            raise IOError(errno.ENOSPC, 'No space left on device')
+        srcpath, destpath = self.moves[0]
+        os.makedirs(os.path.dirname(destpath))
+        shutil.copyfileobj, copyfileobj = copyfileobj, shutil.copyfileobj
+        try:
+            self.assertRaises(IOError, transfer.copy, srcpath, destpath)
+        finally:
+            shutil.copyfileobj = copyfileobj
+        self.assertEqual([], os.listdir(os.path.dirname(destpath)))
+
+    def test_files_are_copied_unless_move_is_configured(self):
+        configuration = default_configuration()
+        self.assertEqual(8, files.move_to_library(configuration, self.moves))
+        self.assertTrue(all(os.path.exists(s) for s, _ in self.moves))
+        shutil.rmtree(self.library)
+        configuration['import']['move'] = True
+        self.assertEqual(8, files.move_to_library(configuration, self.moves))
+        self.assertFalse(any(os.path.exists(s) for s, _ in self.moves))
+        self.assertTrue(all(os.path.exists(d) for _, d in self.moves))
+
+    def test_files_are_linked_in_hardlink_mode(self):
+        configuration = default_configuration()
+        configuration['import']['mode'] = 'hardlink'
+        self.assertEqual(8, files.move_to_library(configuration, self.moves))
+        for srcpath, destpath in self.moves:
+            self.assertTrue(os.path.samefile(srcpath, destpath))
+
+    def test_links_replace_books_already_in_the_library(self):
+        srcpath, destpath = self.moves[0]
+        os.makedirs(os.path.dirname(destpath))
+        with open(destpath, 'w') as f:
+            f.write('old')
+        transfer.hardlink(srcpath, destpath)
+        self.assertTrue(os.path.samefile(srcpath, destpath))
+        self.assertEqual([os.path.basename(destpath)],
+                         os.listdir(os.path.dirname(destpath)))
+
+    def test_failed_clones_leave_nothing_behind(self):
+        if transfer.fcntl is None:
+            return
+        def ioctl(fd, request, arg):
+            raise IOError(errno.ENOSPC, 'No space left on device')
+        srcpath, destpath = self.moves[0]
+        os.makedirs(os.path.dirname(destpath))
+        transfer.fcntl.ioctl, ioctl = ioctl, transfer.fcntl.ioctl
+        try:
+            self.assertRaises(IOError, transfer.reflink, srcpath, destpath)
+        finally:
+            transfer.fcntl.ioctl = ioctl
+        self.assertEqual([], os.listdir(os.path.dirname(destpath)))
+
+    def test_files_are_copied_when_they_cannot_be_linked(self):
+        def link(srcpath, destpath):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        transfer.link, link = link, transfer.link
+        try:
+            self.assertEqual(8, transfer.Transfer(transfer.hardlink)
+                             .run(self.moves))
+        finally:
+            transfer.link = link
+        self.assertCopied()
+        for srcpath, destpath in self.moves:
+            self.assertFalse(os.path.samefile(srcpath, destpath))
+
+    def test_files_are_cloned_or_copied_in_reflink_mode(self):
+        self.assertEqual(8, transfer.Transfer(transfer.reflink)
+                         .run(self.moves))
+        self.assertCopied()
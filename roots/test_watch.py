@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Watcher unit tests.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from command import Watch
+from configuration import default_configuration, compile_regex
+import files
+import search
+import storage
+from testing import write_epub
+import watch
+
+
+class WatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.kept = self._write('kept.epub')
+        self.changed = self._write('changed.epub')
+        self.removed = self._write('removed.epub')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content='book'):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _change(self):
+        self._write('changed.epub', 'revised book')
+        os.remove(self.removed)
+        return self._write(os.path.join('new', 'added.epub'))
+
+    def test_changes_since_the_cache_was_made_are_found(self):
+        cache = {path: (files.signature(path), {})
+                 for path in (self.kept, self.changed, self.removed)}
+        added = self._change()
+        self.assertEquals({self.changed, self.removed, added},
+                          watch.changed(self.directory, cache))
+
+    def test_changes_are_found_by_polling(self):
+        poller = watch.Poller([self.directory], 0)
+        added = self._change()
+        self.assertEquals({self.changed, self.removed, added},
+                          poller.changes())
+        self.assertEquals(set(), poller.changes())
+
+    def test_changes_are_found_with_inotify(self):
+        try:
+            watcher = watch.Inotify([self.directory])
+        except (OSError, AttributeError):
+            self.skipTest('inotify is not available')
+        try:
+            self._write('changed.epub', 'revised book')
+            os.remove(self.removed)
+            os.makedirs(os.path.join(self.directory, 'new'))
+            paths = watcher.changes(1)
+            added = self._write(os.path.join('new', 'added.epub'))
+            paths.update(watcher.changes(1))
+        finally:
+            watcher.close()
+        self.assertEquals({self.changed, self.removed, added,
+                           os.path.dirname(added)}, paths)
+
+    def test_books_linked_in_are_found_with_inotify(self):
+        try:
+            watcher = watch.Inotify([self.directory])
+        except (OSError, AttributeError):
+            self.skipTest('inotify is not available')
+        linked = os.path.join(self.directory, 'linked.epub')
+        try:
+            os.link(self.kept, linked)
+            paths = watcher.changes(1)
+        finally:
+            watcher.close()
+        self.assertEquals({linked}, paths)
+
+    def test_paths_inotify_cannot_take_are_polled(self):
+        directory = os.path.join(self.directory, u'B\xfccher')
+        try:
+            os.mkdir(directory)
+        except UnicodeError:
+            self.skipTest('file names are not unicode')
+        watcher = watch.watcher([directory], 0)
+        watcher.close()
+        self.assertTrue(isinstance(watcher, watch.Poller))
+
+    def test_changes_are_reported_once_they_stop(self):
+        events = iter([{'a'}, {'b'}, set(), {'c'}, set()])
+        class Watcher(object):
+            def changes(self, timeout):
+                return next(events)
+        batches = watch.batches(Watcher(), 0.01)
+        self.assertEquals({'a', 'b'}, next(batches))
+        self.assertEquals({'c'}, next(batches))
+
+
+class SyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.configuration = default_configuration()
+        self.configuration['directory'] = self.directory
+        self.configuration['system']['configpath'] = self.directory
+        compile_regex(self.configuration)
+        self.author = os.path.join(self.directory, 'Gillian Flynn')
+        os.makedirs(self.author)
+        for title in ('Gone Girl', 'Dark Places'):
+            write_epub(os.path.join(self.author, title + '.epub'),
+                       title, 'Flynn, Gillian')
+        self.watch = Watch({'watch': True}, self.configuration)
+        self.cache = {}
+        self.watch._sync(watch.changed(self.directory, self.cache),
+                         self.directory, self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_books_in_a_directory_which_is_removed_are_removed(self):
+        self.assertEquals(2, len(list(storage.load_books(self.configuration))))
+        shutil.move(self.author, self.directory + '.moved')
+        try:
+            self.watch._sync({self.author}, self.directory, self.cache)
+        finally:
+            shutil.rmtree(self.directory + '.moved')
+        self.assertEquals([], list(storage.load_books(self.configuration)))
+        self.assertEquals({}, self.cache)
+        self.assertFalse(search.search(self.configuration, u'girl'))
+
+    def test_libraries_with_non_ascii_names_are_watched(self):
+        library = os.path.join(self.directory, u'B\xfccher')
+        author = os.path.join(library, u'Gillian Flynn').encode('utf-8')
+        os.makedirs(author)
+        write_epub(os.path.join(author, 'Sharp Objects.epub'),
+                   'Sharp Objects', 'Flynn, Gillian')
+        self.configuration['directory'] = library
+        batches = watch.batches
+        def interrupted(watcher, debounce):
+            raise KeyboardInterrupt()
+        watch.batches = interrupted
+        try:
+            _, err = Watch({'watch': True}, self.configuration).execute()
+        finally:
+            watch.batches = batches
+        self.assertEquals(None, err)
+        self.assertIn(u'Sharp Objects',
+                      [book['title'] for book in
+                       storage.load_books(self.configuration)])
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers shared by the unit tests.
+"""
+
+import zipfile
+
+
+def write_epub(path, title, author):
+    """Writes a minimal e-book."""
+    with zipfile.ZipFile(path, 'w') as epub:
+        epub.writestr('META-INF/container.xml',
+                      '<?xml version="1.0"?>'
+                      '<container version="1.0" xmlns="urn:oasis:names:tc:'
+                      'opendocument:xmlns:container"><rootfiles>'
+                      '<rootfile full-path="content.opf"/>'
+                      '</rootfiles></container>')
+        epub.writestr('content.opf',
+                      '<?xml version="1.0" encoding="utf-8"?>'
+                      '<package xmlns="http://www.idpf.org/2007/opf">'
+                      '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                      '<dc:title>%s</dc:title><dc:creator>%s</dc:creator>'
+                      '</metadata></package>' % (title, author))
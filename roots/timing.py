@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timing spans.
+
+The stages that a command spends its time in are wrapped in named
+spans:
+
+    with timing.span('parse'):
+        ...
+
+or, for a whole function, with the `timed` decorator.
+
+Spans are only timed once timing has been enabled (by `root --profile`);
+until then they cost one function call. Spans may overlap, so the times
+of the stages need not add up to the time of the command. Time spent in
+worker processes is not seen; it shows up as the time the command waited
+for them.
+"""
+
+from functools import wraps
+from threading import Lock
+import time
+
+_enabled = False
+_lock = Lock()
+# name -> [calls, seconds]
+_totals = {}
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+def add(name, seconds, calls=1):
+    """Adds time to a stage.
+    """
+    with _lock:
+        total = _totals.setdefault(name, [0, 0.0])
+        total[0] += calls
+        total[1] += seconds
+
+
+def span(name):
+    """Returns a context manager which times its block as the named
+    stage.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorates a function so that its calls are timed as the named
+    stage.
+    """
+    def decorate(function):
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorate
+
+
+def iterate(name, iterable):
+    """Times each step through an iterable as the named stage, for
+    generators which do their work as they are iterated.
+    """
+    if not _enabled:
+        return iterable
+    return _iterate(name, iterable)
+
+
+def _iterate(name, iterable):
+    iterator = iter(iterable)
+    calls, seconds = 0, 0.0
+    try:
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                seconds += time.time() - start
+                return
+            seconds += time.time() - start
+            calls += 1
+            yield item
+    finally:
+        add(name, seconds, calls)
+
+
+def totals():
+    """Returns the calls to and seconds spent in each stage, by name.
+    """
+    with _lock:
+        return {name: tuple(total) for name, total in _totals.iteritems()}
+
+
+def report():
+    """Returns a table of the stages, slowest first.
+    """
+    lines = ['%-16s %8s %10s' % ('stage', 'calls', 'seconds')]
+    for name, (calls, seconds) in sorted(totals().iteritems(),
+                                         key=lambda item: -item[1][1]):
+        lines.append('%-16s %8d %10.3f' % (name, calls, seconds))
+    return '\n'.join(lines)
+
+
+class _Span(object):
+
+    __slots__ = ('_name', '_start')
+
+    def __init__(self, name):
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *_):
+        add(self._name, time.time() - self._start)
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
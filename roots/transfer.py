@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Copies and moves files into the library.
+
+Files are transferred by a bounded pool of threads, since copying from
+slow media spends most of its time waiting on I/O. On Linux, the bytes
+are copied by the kernel (copy_file_range, or sendfile on older kernels)
+without passing through the interpreter; elsewhere they are copied a
+chunk at a time.
+
+Books can also be linked into the library rather than copied: see
+`MODES`. Links which cannot be made, for instance because the library is
+on another filesystem, fall back to copies.
+"""
+
+from __future__ import print_function
+
+from os import makedirs, fstat, link, listdir, rename, remove, close
+from os.path import join, dirname, basename, isdir, getsize, lexists
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+import ctypes
+import ctypes.util
+import errno
+import shutil
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import timing
+
+# bytes read at a time when a file is copied or hashed
+CHUNK_SIZE = 1 << 20
+
+# the suffix of files being written in place of a destination
+_PARTIAL = '.part'
+
+# ioctl which shares a file's extents with another on the same
+# filesystem (btrfs, xfs, ...), from linux/fs.h
+_FICLONE = 0x40049409
+
+# errors meaning that the kernel cannot copy between these files, and
+# the copy should be made in user space instead
+_UNSUPPORTED = (errno.ENOSYS, errno.EINVAL, errno.EXDEV, errno.EOPNOTSUPP,
+                errno.EBADF)
+
+# errors meaning that a link cannot be made between these paths
+_UNLINKABLE = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP,
+               errno.EINVAL, errno.ENOTTY, errno.ENOSYS)
+
+
+def _libc_function(name, *argtypes):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        function = getattr(libc, name)
+    except (OSError, AttributeError, TypeError):
+        return None
+    function.argtypes = argtypes
+    function.restype = ctypes.c_ssize_t
+    return function
+
+_copy_file_range = _libc_function(
+    'copy_file_range', ctypes.c_int, ctypes.c_void_p, ctypes.c_int,
+    ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint)
+
+_sendfile = _libc_function(
+    'sendfile', ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t)
+
+
+def _kernel_copy(function, srcfd, destfd, size):
+    """Copies size bytes between file descriptors with a system call.
+    Returns False, having copied nothing, if the call is not supported
+    for these files.
+    """
+    copied = 0
+    while copied < size:
+        if function is _copy_file_range:
+            count = function(srcfd, None, destfd, None, size - copied, 0)
+        else:
+            count = function(destfd, srcfd, None, size - copied)
+        if count < 0:
+            code = ctypes.get_errno()
+            if copied == 0 and code in _UNSUPPORTED:
+                return False
+            raise OSError(code, errno.errorcode.get(code, 'copy failed'))
+        if count == 0:
+            break
+        copied += count
+    return True
+
+
+def partial_paths(destpath):
+    """Returns the paths of any files left being written in place of a
+    destination, by a transfer which did not finish.
+    """
+    directory, name = dirname(destpath), basename(destpath)
+    try:
+        names = listdir(directory or '.')
+    except OSError:
+        return []
+    return [join(directory, partial) for partial in names
+            if partial.startswith('.%s.' % name)
+            and partial.endswith(_PARTIAL)]
+
+
+@contextmanager
+def _replacing(destpath):
+    """Yields a temporary path next to a destination, which is renamed
+    over the destination if the block succeeds, and removed if it does
+    not, so that a destination is never left partly written.
+    """
+    descriptor, temporary = tempfile.mkstemp(
+        prefix='.%s.' % basename(destpath), suffix=_PARTIAL,
+        dir=dirname(destpath) or '.')
+    close(descriptor)
+    try:
+        yield temporary
+        rename(temporary, destpath)
+        # renaming a link to a file over the file itself does nothing
+        if lexists(temporary):
+            remove(temporary)
+    except BaseException:
+        if lexists(temporary):
+            remove(temporary)
+        raise
+
+
+def copy(srcpath, destpath):
+    """Copies a file and its metadata, like shutil.copy2, without
+    passing the contents through user space where the kernel allows.
+    """
+    with _replacing(destpath) as temporary:
+        with open(srcpath, 'rb') as src:
+            with open(temporary, 'wb') as dest:
+                size = fstat(src.fileno()).st_size
+                for function in (_copy_file_range, _sendfile):
+                    if function is not None and _kernel_copy(
+                            function, src.fileno(), dest.fileno(), size):
+                        break
+                else:
+                    shutil.copyfileobj(src, dest, CHUNK_SIZE)
+        shutil.copystat(srcpath, temporary)
+
+
+def move(srcpath, destpath):
+    """Moves a file, renaming it if it stays on the same filesystem.
+    """
+    shutil.move(srcpath, destpath)
+
+
+def hardlink(srcpath, destpath):
+    """Links a file into place, replacing any file there, or copies it
+    if it cannot be linked.
+    """
+    try:
+        with _replacing(destpath) as temporary:
+            remove(temporary)
+            link(srcpath, temporary)
+    except OSError, e:
+        if e.errno not in _UNLINKABLE:
+            raise
+        copy(srcpath, destpath)
+
+
+def reflink(srcpath, destpath):
+    """Clones a file, so that the copy shares its contents until one of
+    them is written, or copies it if the filesystem cannot clone it.
+    """
+    if fcntl is None:
+        return copy(srcpath, destpath)
+    try:
+        with _replacing(destpath) as temporary:
+            with open(srcpath, 'rb') as src:
+                with open(temporary, 'wb') as dest:
+                    fcntl.ioctl(dest.fileno(), _FICLONE, src.fileno())
+            shutil.copystat(srcpath, temporary)
+    except (IOError, OSError), e:
+        if e.errno not in _UNLINKABLE:
+            raise
+        copy(srcpath, destpath)
+
+
+# the ways books can be put into the library, by `import.mode`
+MODES = {
+    'copy': copy,
+    'move': move,
+    'hardlink': hardlink,
+    'reflink': reflink
+}
+
+# what each mode does to a book, for telling the user
+DONE = {
+    'copy': 'copied',
+    'move': 'moved',
+    'hardlink': 'hard linked',
+    'reflink': 'reflinked'
+}
+
+
+class Transfer(object):
+    """Transfers files to their destinations with a number of
+    concurrent workers, creating each destination directory once. The
+    directories files were transferred out of are kept in `sources`.
+    """
+
+    def __init__(self, function=copy, workers=1):
+        self._function = function
+        self._workers = max(1, workers)
+        self._lock = Lock()
+        self._directories = set()
+        self.sources = set()
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @timing.timed('transfer')
+    def run(self, moves):
+        """Transfers each (srcpath, destpath) pair. Returns the number
+        of files transferred.
+        """
+        start = time.time()
+        moves = list(moves)
+        if self._workers == 1 or len(moves) < 2:
+            results = [self._transfer(pair) for pair in moves]
+        else:
+            pool = ThreadPool(min(self._workers, len(moves)))
+            try:
+                results = pool.map(self._transfer, moves, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        self.seconds += time.time() - start
+        return sum(results)
+
+    def report(self):
+        """Returns a description of the throughput of the transfers.
+        """
+        seconds = max(self.seconds, 1e-6)
+        return '%d files, %.1f MB in %.2fs (%.1f files/s, %.1f MB/s)' % (
+            self.files, self.bytes / 1e6, self.seconds,
+            self.files / seconds, self.bytes / 1e6 / seconds)
+
+    def _transfer(self, pair):
+        srcpath, destpath = pair
+        destdir = dirname(destpath)
+        try:
+            self._makedirs(destdir)
+        except OSError:
+            self._print("Error creating path %s" % destdir)
+            return 0
+        try:
+            size = getsize(srcpath)
+            self._function(srcpath, destpath)
+        except (IOError, OSError), e:
+            self._print("Error importing %s (%s)" % (srcpath, e.errno))
+            return 0
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            self.sources.add(dirname(srcpath))
+            print("%s ->\n%s" % (basename(srcpath), destpath))
+        return 1
+
+    def _makedirs(self, directory):
+        with self._lock:
+            if directory in self._directories:
+                return
+        try:
+            makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST or not isdir(directory):
+                raise
+        with self._lock:
+            self._directories.add(directory)
+
+    def _print(self, message):
+        with self._lock:
+            print(message)
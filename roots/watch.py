@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Tom Regan
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Watches directories for e-books which are added, changed or removed.
+
+On Linux the directories are watched with inotify, which Python 2 does
+not expose, so it is called through ctypes. Elsewhere, or if inotify
+cannot be used, the directories are scanned at an interval instead.
+Either way a watcher reports the paths which changed: a path which no
+longer exists was removed, and a directory should be scanned again
+(see `changed`).
+"""
+
+from os import walk, read, close
+from os.path import join, sep
+from select import select
+import ctypes
+import ctypes.util
+import errno
+import struct
+import time
+
+import files
+
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0o2000000
+
+_MASK = (_IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+         _IN_DELETE)
+
+_EVENT = struct.Struct('iIII')
+
+# changes are reported at the latest after this many debounce periods,
+# even if more keep arriving
+_MAX_DELAY = 10
+
+
+def is_book(path):
+    return path.lower().endswith('.epub')
+
+
+def scan(directory):
+    """Returns the signature (see `files.signature`) of every book under
+    a directory, by path.
+    """
+    signatures = {}
+    for basepath, _, filenames in walk(directory):
+        for filename in filenames:
+            if is_book(filename):
+                path = join(basepath, filename)
+                current = files.signature(path)
+                if current is not None:
+                    signatures[path] = current
+    return signatures
+
+
+def changed(directory, cache):
+    """Returns the paths of books under a directory which differ from
+    their entries in a stat cache, or are missing from it, and of those
+    in the cache which are gone.
+    """
+    current = scan(directory)
+    paths = {path for path, signature in current.iteritems()
+             if path not in cache or cache[path][0] != signature}
+    prefix = directory.rstrip(sep) + sep
+    paths.update(path for path in cache
+                 if path.startswith(prefix) and path not in current)
+    return paths
+
+
+def watcher(directories, interval):
+    """Returns a watcher for the directories, using inotify if it can.
+    """
+    try:
+        return Inotify(directories)
+    except (OSError, AttributeError, TypeError, ctypes.ArgumentError):
+        return Poller(directories, interval)
+
+
+def batches(watcher, debounce):
+    """Yields sets of changed paths, once no more changes have arrived
+    for `debounce` seconds.
+    """
+    pending, first = set(), None
+    while True:
+        paths = watcher.changes(debounce if pending else None)
+        if paths:
+            if not pending:
+                first = time.time()
+            pending.update(paths)
+            if time.time() - first < debounce * _MAX_DELAY:
+                continue
+        if pending:
+            yield pending
+            pending = set()
+
+
+class Inotify(object):
+    """Watches directory trees with inotify.
+    """
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32)
+        self._fd = libc.inotify_init1(_IN_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, errno.errorcode.get(code, 'inotify'))
+        self._directories = directories
+        self._watches = {}
+        try:
+            for directory in directories:
+                self._add_tree(directory)
+        except (OSError, ctypes.ArgumentError):
+            self.close()
+            raise
+
+    def changes(self, timeout=None):
+        """Waits up to `timeout` seconds, or for ever, for changes and
+        returns the paths which changed.
+        """
+        ready, _, _ = select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = read(self._fd, 1 << 16)
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # events were lost, so everything has to be looked at
+                paths.update(self._directories)
+                continue
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches or not name:
+                continue
+            path = join(self._watches[wd], name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self._add_tree(path)
+                paths.add(path)
+            elif is_book(name):
+                # a file created by a link is complete, and no
+                # IN_CLOSE_WRITE follows; a file being written is read
+                # again when it is closed
+                paths.add(path)
+        return paths
+
+    def close(self):
+        if self._fd is not None:
+            close(self._fd)
+            self._fd = None
+
+    def _add_tree(self, directory):
+        for basepath, _, _ in walk(directory):
+            wd = self._add_watch(self._fd, basepath, _MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code == errno.ENOENT:
+                    continue
+                raise OSError(code, errno.errorcode.get(code, 'inotify'),
+                              basepath)
+            self._watches[wd] = basepath
+
+
+class Poller(object):
+    """Watches directory trees by scanning them at an interval.
+    """
+
+    def __init__(self, directories, interval):
+        self._directories = directories
+        self._interval = interval
+        self._signatures = self._scan()
+        self._next = time.time() + interval
+
+    def changes(self, timeout=None):
+        now = time.time()
+        wait = self._next - now
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0, wait))
+        self._next = time.time() + self._interval
+        signatures = self._scan()
+        paths = {path for path, signature in signatures.iteritems()
+                 if self._signatures.get(path) != signature}
+        paths.update(set(self._signatures).difference(signatures))
+        self._signatures = signatures
+        return paths
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        signatures = {}
+        for directory in self._directories:
+            signatures.update(scan(directory))
+        return signatures